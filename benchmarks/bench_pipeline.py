@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+边界文件检查流程基准测试
+用合成数据（见 synthetic_data.py）按阶段计时检查流程，报告各阶段吞吐量和峰值内存，
+作为版本间性能对比的基线。
+
+计时的阶段（单个ZIP的阶段即检查工具 _check_zip_file 中 StageTimer 记录的阶段）：
+- extract    从ZIP读取shp文件组
+- encoding   属性表编码检测
+- read       读取几何和属性
+- validity   几何有效性检查（向量化）
+- checks     字段和坐标系检查
+- transform  申报坐标转换到图层坐标系
+- contain    点面包含检查
+- centroid   未通过地块的代表点计算
+- map_layer  生成单个地块的地图图层数据
+- map        将图层添加到地图并保存HTML
+- excel      写出result工作表
+
+使用方法：
+python benchmarks/bench_pipeline.py --sizes 10,1000,10000
+python benchmarks/bench_pipeline.py --sizes 1000 --end-to-end --workers 8 --json bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import folium  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import boundary_check_tool as bct  # noqa: E402
+from synthetic_data import generate_dataset  # noqa: E402
+
+STAGES = bct.ZIP_TIMING_STAGES + ['map', 'excel']
+
+
+class StageRecorder:
+    """累计各阶段耗时，可选记录各阶段的峰值内存增量"""
+
+    def __init__(self, measure_memory=False):
+        self.measure_memory = measure_memory
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.peak_bytes = dict.fromkeys(STAGES, 0)
+        self.overall_peak_bytes = 0  # 整个运行的峰值内存（各阶段都会重置tracemalloc的峰值，需要单独累计）
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.measure_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            if self.measure_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.peak_bytes[name] = max(self.peak_bytes[name], peak - baseline)
+                self.overall_peak_bytes = max(self.overall_peak_bytes, peak)
+
+    def check_zip(self, task):
+        """用检查工具的 _check_zip_file 检查一个ZIP，将其 StageTimer 记录的各阶段耗时和峰值内存计入对应阶段"""
+        if self.measure_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        timer = bct.StageTimer(trace_memory=self.measure_memory)
+        result_dict, layer = bct._check_zip_file(task, timer)
+        for name, seconds in timer.seconds.items():
+            self.seconds[name] += seconds
+        for name, peak in timer.peak_memory.items():
+            self.peak_bytes[name] = max(self.peak_bytes[name], peak - baseline)
+            self.overall_peak_bytes = max(self.overall_peak_bytes, peak)
+        return result_dict, layer
+
+
+def run_stages(folder, land_block_df, recorder):
+    """逐个ZIP运行检查工具的单图层检查（与检查进程中相同的代码），再生成地图和result工作表，返回成功读取的地块数量"""
+    rows = land_block_df.set_index('地块编码', drop=False).to_dict('index')
+    zip_files = sorted(f for f in os.listdir(folder) if f.lower().endswith('.zip'))
+    results = bct.ResultTable(bct.RESULT_COLUMNS + bct.ZIP_TIMING_COLUMNS)
+    layers = []
+    loaded = 0
+
+    for zip_file in zip_files:
+        code = bct.extract_land_block_code(zip_file)
+        result_dict, layer = recorder.check_zip({
+            'zip_path': os.path.join(folder, zip_file),
+            'zip_file': zip_file,
+            'land_block_code': code,
+            'row': rows[code],
+            'add_marker': True,
+        })
+        if result_dict.get('encoding') is not None:
+            loaded += 1
+        if layer is not None:
+            layers.append(layer)
+        result_dict.pop('suggested_point', None)
+        results.append(result_dict)
+
+    output_dir = tempfile.mkdtemp(prefix='bench_output_')
+    try:
+        with recorder.stage('map'):
+            m = folium.Map(location=[23.1, 113.25], zoom_start=10)
+            for layer in layers:
+                bct.add_layer_to_map(m, layer)
+            m.save(os.path.join(output_dir, 'map.html'))
+        with recorder.stage('excel'):
+            bct.write_result_workbook(os.path.join(output_dir, 'result.xlsx'), {'result': results.to_dataframe()},
+                                      keep_existing=False)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return loaded
+
+
+def run_end_to_end(folder, workers):
+    """运行完整检查流程（不弹窗、不使用缓存），返回耗时（秒）"""
+    output_dir = tempfile.mkdtemp(prefix='bench_output_')
+    try:
+        start = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            bct.run_boundary_check(folder,
+                                   output_excel=os.path.join(output_dir, 'result.xlsx'),
+                                   map_path=os.path.join(output_dir, 'map.html'),
+                                   max_workers=workers, incremental=False, show_gui=False)
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def benchmark_size(count, args):
+    """生成指定数量的合成数据并测试，返回该规模的测试结果"""
+    folder = os.path.join(args.workdir, f"synthetic_{count}")
+    if not os.path.isdir(folder):
+        generate_dataset(folder, count, seed=args.seed, max_features=args.max_features)
+    land_block_df = pd.read_excel(os.path.join(folder, "地块信息.xlsx"), dtype={'地块编码': str})
+
+    # 计时：不开启tracemalloc，避免影响耗时
+    timing = StageRecorder()
+    start = time.perf_counter()
+    loaded = run_stages(folder, land_block_df, timing)
+    total_seconds = time.perf_counter() - start
+
+    report = {'parcels': count, 'loaded': loaded, 'total_seconds': total_seconds, 'stages': {}}
+    for name in STAGES:
+        seconds = timing.seconds[name]
+        report['stages'][name] = {
+            'seconds': seconds,
+            'ms_per_parcel': seconds * 1000 / count,
+            'parcels_per_second': count / seconds if seconds else None,
+        }
+
+    # 峰值内存：单独再运行一遍
+    if not args.no_memory:
+        memory = StageRecorder(measure_memory=True)
+        tracemalloc.start()
+        try:
+            run_stages(folder, land_block_df, memory)
+            report['peak_traced_mb'] = memory.overall_peak_bytes / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+        for name in STAGES:
+            report['stages'][name]['peak_mb'] = memory.peak_bytes[name] / 1024 / 1024
+
+    if args.end_to_end:
+        seconds = run_end_to_end(folder, args.workers)
+        report['end_to_end'] = {'workers': args.workers, 'seconds': seconds, 'parcels_per_second': count / seconds}
+    return report
+
+
+def print_report(report):
+    """打印单个规模的测试结果表格"""
+    print(f"\n=== {report['parcels']} 个地块（成功读取 {report['loaded']} 个），"
+          f"分阶段总耗时 {report['total_seconds']:.2f} 秒 ===")
+    print(f"{'阶段':<10} {'耗时(s)':>10} {'ms/地块':>10} {'地块/s':>12} {'峰值内存(MB)':>14}")
+    for name in STAGES:
+        stage = report['stages'][name]
+        rate = f"{stage['parcels_per_second']:.1f}" if stage['parcels_per_second'] else '-'
+        peak = f"{stage['peak_mb']:.1f}" if 'peak_mb' in stage else '-'
+        print(f"{name:<10} {stage['seconds']:>10.3f} {stage['ms_per_parcel']:>10.3f} {rate:>12} {peak:>14}")
+    if 'peak_traced_mb' in report:
+        print(f"整体峰值内存（tracemalloc）: {report['peak_traced_mb']:.1f} MB")
+    if 'end_to_end' in report:
+        e2e = report['end_to_end']
+        print(f"完整流程（{e2e['workers']} 进程）: {e2e['seconds']:.2f} 秒，{e2e['parcels_per_second']:.1f} 地块/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="边界文件检查流程基准测试")
+    parser.add_argument('--sizes', default='10,1000,10000', help="地块数量列表，逗号分隔（默认：10,1000,10000）")
+    parser.add_argument('--seed', type=int, default=0, help="合成数据随机种子（默认：0）")
+    parser.add_argument('--max-features', type=int, default=1, help="面图层的最大要素数（默认：1）")
+    parser.add_argument('--workdir', help="合成数据保存目录（默认：临时目录，测试后删除）")
+    parser.add_argument('--no-memory', action='store_true', help="不测量峰值内存（省去第二遍运行）")
+    parser.add_argument('--end-to-end', action='store_true', help="同时计时完整检查流程 run_boundary_check")
+    parser.add_argument('--workers', type=int, default=bct.DEFAULT_MAX_WORKERS,
+                        help="完整流程使用的进程数（默认：CPU核心数）")
+    parser.add_argument('--json', help="将测试结果保存为JSON文件")
+    args = parser.parse_args(argv)
+
+    keep_workdir = args.workdir is not None
+    if not keep_workdir:
+        args.workdir = tempfile.mkdtemp(prefix='bench_data_')
+
+    reports = []
+    try:
+        for count in [int(size) for size in args.sizes.split(',') if size.strip()]:
+            report = benchmark_size(count, args)
+            print_report(report)
+            reports.append(report)
+    finally:
+        if not keep_workdir:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'reports': reports,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n测试结果已保存到 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
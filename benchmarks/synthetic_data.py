@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+合成测试数据生成器
+生成与真实提交格式一致的边界文件ZIP（*X.zip，X为13位地块编码）和配套的地块信息.xlsx，
+用于基准测试和复现问题。
+
+覆盖的变化情况：
+- 几何类型：面（可含多个要素）、点、线
+- 属性表编码：GBK、UTF-8
+- 有/无 .cpg 文件，有/无 .prj 文件
+- 坐标系：CGCS2000 3度带高斯-克吕格投影坐标系、CGCS2000地理坐标系
+- ZIP内文件名：GBK编码（Windows压缩软件常见）、UTF-8标记
+- 申报坐标：在边界内、在边界外
+
+使用方法：
+python benchmarks/synthetic_data.py 输出文件夹 --count 1000 --seed 0
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import zipfile
+
+import pandas as pd
+import shapefile
+from pyproj import CRS, Transformer
+
+GEOGRAPHIC_EPSG = 4490  # CGCS2000地理坐标系
+PROJECTED_EPSG = {37: 4525, 38: 4526, 39: 4527}  # CGCS2000 3度带高斯-克吕格投影（按带号）
+REQUIRED_FIELDS = [('DKMC', 'C', 50), ('DKBM', 'C', 20), ('XZQDM', 'C', 12), ('XZQMC', 'C', 50)]
+
+
+def gk_zone(lon):
+    """返回经度所在的3度带带号"""
+    return int(round(lon / 3.0))
+
+
+def _polygon_ring(cx, cy, half_size):
+    """生成以 (cx, cy) 为中心的顺时针矩形外环"""
+    return [(cx - half_size, cy - half_size), (cx - half_size, cy + half_size),
+            (cx + half_size, cy + half_size), (cx + half_size, cy - half_size),
+            (cx - half_size, cy - half_size)]
+
+
+def build_shapefile(geometry_type, center, half_size, feature_count, dbf_encoding, parcel_name, code):
+    """在内存中写出一个shp文件组，返回 {扩展名: 文件内容}"""
+    buffers = {ext: io.BytesIO() for ext in ('.shp', '.shx', '.dbf')}
+    shape_types = {'polygon': shapefile.POLYGON, 'point': shapefile.POINT, 'line': shapefile.POLYLINE}
+    writer = shapefile.Writer(shp=buffers['.shp'], shx=buffers['.shx'], dbf=buffers['.dbf'],
+                              shapeType=shape_types[geometry_type], encoding=dbf_encoding)
+    for name, field_type, size in REQUIRED_FIELDS:
+        writer.field(name, field_type, size)
+    writer.field('YDMJ', 'N', 18, 2)
+
+    cx, cy = center
+    step = half_size * 2 / max(feature_count, 1)
+    for index in range(feature_count):
+        # 多要素图层：沿x方向排列的相邻小地块，第 feature_count // 2 个要素的中心为图层中心（申报坐标落在该要素内）
+        fx = cx + step * (index - feature_count // 2)
+        if geometry_type == 'polygon':
+            writer.poly([_polygon_ring(fx, cy, step / 2 * 0.98)])
+        elif geometry_type == 'point':
+            writer.point(fx, cy)
+        else:
+            writer.line([[(fx - step / 2, cy - half_size), (fx + step / 2, cy + half_size)]])
+        writer.record(f"{parcel_name}-{index + 1}", code, code[:6], '测试区', round((step * half_size * 2), 2))
+    writer.close()
+    return {ext: buffer.getvalue() for ext, buffer in buffers.items()}
+
+
+class GbkNameZipInfo(zipfile.ZipInfo):
+    """文件名按GBK编码写入、不设置UTF-8标记的ZIP成员（模拟Windows压缩软件生成的ZIP）
+
+    zipfile写入非ASCII文件名时总是使用UTF-8并设置标记位，只能在成员自身的ZipInfo上改为GBK，不影响其他ZIP的写入。
+    """
+
+    def _encodeFilenameFlags(self):
+        return self.filename.encode('gbk'), self.flag_bits
+
+
+def write_zip(zip_path, members, gbk_names):
+    """写出ZIP文件，gbk_names为True时文件名按GBK编码且不设置UTF-8标记"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in members.items():
+            if gbk_names:
+                # 与 writestr(文件名) 生成的成员相同的时间、压缩方式和权限
+                info = GbkNameZipInfo(name, date_time=time.localtime(time.time())[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o600 << 16
+                zip_ref.writestr(info, data)
+            else:
+                zip_ref.writestr(name, data)
+
+
+def generate_dataset(folder, count, seed=0, max_features=1):
+    """生成 count 个边界文件ZIP和地块信息.xlsx，返回生成的地块信息DataFrame
+
+    max_features 为面图层的最大要素数（大于1时部分图层为多要素的地块级图层）。
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    transformers = {}
+    rows = []
+
+    for index in range(count):
+        code = f"44{index:011d}"
+        lon = 111.0 + rng.random() * 5.5  # 广东省大致经度范围
+        lat = 21.5 + rng.random() * 3.5
+        parcel_name = f"测试地块{index}"
+
+        geometry_type = rng.choices(['polygon', 'point', 'line'], weights=[8, 1, 1])[0]
+        dbf_encoding = rng.choice(['gbk', 'utf-8'])
+        with_cpg = rng.random() < 0.8
+        with_prj = rng.random() < 0.9
+        projected = rng.random() < 0.8
+        gbk_names = rng.random() < 0.5
+        declared_inside = rng.random() < 0.85
+        feature_count = rng.randint(1, max_features) if geometry_type == 'polygon' else 1
+
+        # 边界中心点（投影坐标系下约200米见方的地块）
+        if projected:
+            epsg = PROJECTED_EPSG.get(gk_zone(lon), 4526)
+            transformer = transformers.get(epsg)
+            if transformer is None:
+                transformer = transformers[epsg] = Transformer.from_crs(GEOGRAPHIC_EPSG, epsg, always_xy=True)
+            center = transformer.transform(lon, lat)
+            half_size = 100.0
+        else:
+            epsg = GEOGRAPHIC_EPSG
+            center = (lon, lat)
+            half_size = 0.001
+
+        shp_stem = f"边界文件/{parcel_name}"
+        members = {f"{shp_stem}{ext}": data for ext, data in build_shapefile(
+            geometry_type, center, half_size, feature_count, dbf_encoding, parcel_name, code).items()}
+        if with_cpg:
+            members[f"{shp_stem}.cpg"] = b'GBK' if dbf_encoding == 'gbk' else b'UTF-8'
+        if with_prj:
+            members[f"{shp_stem}.prj"] = CRS.from_epsg(epsg).to_wkt('WKT1_ESRI').encode('utf-8')
+
+        prefix = rng.choice(['初步调查', '详细调查'])
+        write_zip(os.path.join(folder, f"{prefix}{code}.zip"), members, gbk_names)
+
+        # 申报坐标：在边界内取中心点，在边界外向东偏移约1公里
+        rows.append({
+            '地块编码': code,
+            '地块名称': parcel_name,
+            '经度': round(lon if declared_inside else lon + 0.01, 6),
+            '纬度': round(lat, 6),
+        })
+
+    land_block_df = pd.DataFrame(rows)
+    land_block_df.to_excel(os.path.join(folder, "地块信息.xlsx"), index=False)
+    return land_block_df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成的边界文件ZIP和地块信息.xlsx")
+    parser.add_argument('folder', help="输出文件夹")
+    parser.add_argument('--count', type=int, default=100, help="地块数量（默认：100）")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子（默认：0）")
+    parser.add_argument('--max-features', type=int, default=1, help="面图层的最大要素数（默认：1）")
+    args = parser.parse_args(argv)
+
+    generate_dataset(args.folder, args.count, seed=args.seed, max_features=args.max_features)
+    print(f"已生成 {args.count} 个边界文件ZIP和地块信息.xlsx: {args.folder}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,32 +5,121 @@
 import os
 import re
 import sys
+import io
+import codecs
+import struct
 import zipfile
+import fnmatch
+import argparse
+import importlib.util
+import multiprocessing
+import contextlib
+import cProfile
+import pstats
+import tracemalloc
+import threading
+import queue
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # 尝试导入模块，如果失败则给出友好提示
 try:
     import geopandas as gpd
     import pandas as pd
     import folium
-    import tkinter as tk
-    import shapefile
-    from tkinter import ttk, filedialog
+    import numpy as np
+    import shapely
     from shapely.geometry import Point
-    import shutil
-    import glob
+    from pyproj import Geod, Transformer
     from collections import defaultdict
     import time
     import traceback
+    import json
+    import shutil
+    import tempfile
+    import enum
+    from collections import Counter, namedtuple
+    from functools import lru_cache
+    import hashlib
+    import sqlite3
+    import urllib.parse
+    from branca.element import MacroElement
+    from jinja2 import Template
+    from openpyxl import Workbook, load_workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
     import chardet  # 用于自动检测编码
     from typing import Optional
 except ImportError as e:
     print(f"缺少必要的依赖库: {e}")
     print("请确保已安装所有依赖后再运行程序")
     print("如果是EXE版本，请联系作者获取完整版本")
-    input("按任意键退出...")
+    if sys.stdin is not None and sys.stdin.isatty():  # 无人值守运行时不等待按键
+        input("按任意键退出...")
     sys.exit(1)
 
-TEMP_DIR = "temp_zip_extract"
+# tkinter 仅在图形界面模式下需要，Linux服务器等无图形环境可以不安装
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog
+except ImportError:
+    tk = None
+
+SHP_MEMBER_EXTENSIONS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')  # shp文件组中需要读取的组成文件
+ZIP_UTF8_FLAG = 0x800  # ZIP通用标志位第11位：文件名按UTF-8编码
+SHP_HEADER_SIZE = 100  # .shp文件头长度（文件标识、几何类型、范围）
+SHP_FILE_CODE = 9994  # .shp文件头的文件标识（大端序）
+# .shp文件头中的几何类型代码（含Z/M类型）
+SHP_SHAPE_TYPES = {
+    0: 'null', 1: 'point', 3: 'line', 5: 'polygon', 8: 'point',
+    11: 'point', 13: 'line', 15: 'polygon', 18: 'point',
+    21: 'point', 23: 'line', 25: 'polygon', 28: 'point', 31: 'multipatch',
+}
+# .dbf语言驱动标记（文件头第29字节）对应的编码，只列出能确定编码的值（0x57等表示“系统默认代码页”的值无法确定）
+DBF_LDID_ENCODINGS = {0x4D: 'gbk', 0x7A: 'gbk', 0x4F: 'big5', 0x78: 'big5', 0x13: 'cp932', 0x7B: 'cp932',
+                      0x4E: 'cp949', 0x79: 'cp949'}
+DBF_SAMPLE_VALUES = 200  # 编码解码测试最多使用的非ASCII字段值个数
+ENCODING_SOURCE_CPG = '.cpg文件'  # 编码检测依据（写入result工作表的encoding_source列）
+ENCODING_SOURCE_LDID = 'DBF语言驱动标记'
+ENCODING_SOURCE_DECODE = '字段解码测试'
+ENCODING_SOURCE_CHARDET = 'chardet'
+ENCODING_SOURCE_ASCII = '无非ASCII内容'
+ENCODING_SOURCE_DEFAULT = '默认GBK'
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+CACHE_FILE_NAME = "地块边界检查缓存.sqlite"  # 增量检查缓存文件，保存在地块信息.xlsx旁
+CHECK_RULES_VERSION = "3.6.2"  # 检查规则版本，修改检查逻辑或结果格式时需更新，使旧缓存失效
+EXIT_PASS = 0  # 命令行退出码：所有ZIP均通过检查
+EXIT_FAILED = 1  # 命令行退出码：存在未通过检查的ZIP
+EXIT_ERROR = 2  # 命令行退出码：输入错误或运行出错
+MAP_MODE_INLINE = 'inline'  # 地图图层全部内嵌在HTML中
+MAP_MODE_EXTERNAL = 'external'  # 地图图层写入外部文件，按需加载
+POPUP_FIELDS_ALL = 'all'  # 读取全部属性字段，地图弹窗显示全部属性
+POPUP_FIELDS_REQUIRED = 'required'  # 只读取检查需要的字段
+MAP_OVERVIEW_ZOOM = 13  # 概览图层按该缩放级别的1像素容差简化
+MAP_DETAIL_ZOOM = 14  # 放大到该级别后加载视野内地块的完整边界
+TRANSFORMER_CACHE_SIZE = 32  # 坐标转换器缓存上限（常用的CGCS2000高斯-克吕格分带只有少数几个）
+OVERLAP_MIN_AREA = 1.0  # 跨地块重叠检查：重叠面积（平方米）小于该值时视为相邻边界误差，不报告
+OVERLAP_HASH_GRID = 1e-7  # 判断边界完全相同时的坐标精度（度，约1厘米）
+SUGGEST_POINT_CENTROID = 'centroid'  # 建议坐标取各要素中心点按面积加权的平均（凹多边形时可能落在面外）
+SUGGEST_POINT_SURFACE = 'point_on_surface'  # 建议坐标取面积最大要素内的点（保证落在面内）
+LAYER_THREADS = 4  # ZIP中有多个shp图层时，单个检查进程内并行检查图层的线程数
+INVALID_REASON_LIMIT = 3  # validity列中最多列出几种几何无效原因
+CRS_INFO_CACHE_SIZE = 256  # 坐标系解析结果缓存上限（按.prj文件内容缓存，实际只有几十种.prj）
+TIMING_FILE_SUFFIX = "_耗时统计.json"  # 耗时统计文件，保存在结果Excel旁
+PROFILE_FILE_SUFFIX = "_性能分析.prof"  # cProfile性能分析结果文件，可用 python -m pstats 或 snakeviz 查看
+PROFILE_CPU = 'cpu'  # 使用cProfile分析主进程的函数耗时
+PROFILE_MEMORY = 'memory'  # 使用tracemalloc记录各阶段峰值内存和主要内存分配位置
+STREAM_CHUNK_SIZE = 500  # 流式模式下结果记录每满多少条写入磁盘临时文件（同时提交一次缓存）
+STREAM_RESULT_SUFFIX = "_检查结果.xlsx"  # 流式模式默认的结果文件（保存在地块信息表旁，不修改地块信息表）
+PREFETCH_DEPTH = 0  # 预读ZIP的队列深度（提前读取的ZIP个数），0表示不预读；输入文件夹在网络共享上时建议设为8左右
+PREFETCH_MEMORY_MB = 256  # 预读模式下读取中和检查中的ZIP内容的内存上限（MB）
+PROGRESS_RATE_WINDOW = 50  # 按最近完成的多少个ZIP计算滚动吞吐量和预计剩余时间
+PROGRESS_REFRESH_SECONDS = 0.2  # 终端进度条最短刷新间隔
+PROGRESS_LOG_SECONDS = 10  # 输出不是终端（重定向到日志）时，每隔多少秒输出一行进度
+WATCH_INTERVAL_SECONDS = 10  # 监视模式扫描文件夹的间隔（秒），文件在一个间隔内大小和修改时间都不变才视为写入完成
+ZIP_TIMING_STAGES = ['extract', 'encoding', 'read', 'validity', 'checks', 'transform', 'contain', 'centroid', 'map_layer']  # 单个ZIP的计时阶段
 
 
 def select_input_method() -> Optional[str]:
@@ -87,87 +176,123 @@ def select_folder_path():
     return folder_path
 
 
-def safe_remove_temp_dir():
-    """安全删除临时目录，处理Windows文件锁定问题"""
-    if not os.path.exists(TEMP_DIR):
-        return
-
-    max_attempts = 5
-    for attempt in range(max_attempts):
-        try:
-            shutil.rmtree(TEMP_DIR)
-            return  # 成功删除，退出函数
-        except Exception as e:
-            if attempt < max_attempts - 1:
-                print(f"尝试删除临时目录失败 (第{attempt + 1}次): {str(e)}")
-                time.sleep(1)  # 等待1秒再试
-            else:
-                print(f"无法删除临时目录 {TEMP_DIR}，请手动删除")
-                # 尝试仅清空目录内容
-                try:
-                    for root, dirs, files in os.walk(TEMP_DIR):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            try:
-                                os.chmod(file_path, 0o777)
-                                os.remove(file_path)
-                            except Exception as e:
-                                print(f"无法删除文件 {file_path}: {str(e)}")
-                    # 再次尝试删除目录
-                    shutil.rmtree(TEMP_DIR)
-                except:
-                    pass
-
-
-def detect_encoding(file_path):
-    """检测文件编码"""
-    try:
-        # 尝试从.cpg文件获取编码
-        cpg_path = os.path.splitext(file_path)[0] + ".cpg"
-        if os.path.exists(cpg_path):
-            try:
-                with open(cpg_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    encoding = f.read().strip().lower()
-                    if encoding in ['gbk', 'gb2312', 'cp936', 'ansi']:
-                        return 'gbk'
-                    elif encoding in ['utf-8', 'utf8']:
-                        return 'utf-8'
-                    elif encoding in ['latin1', 'iso-8859-1']:
-                        return 'latin1'
-            except:
-                pass
-
-        # 尝试自动检测DBF文件编码
-        dbf_path = os.path.splitext(file_path)[0] + ".dbf"
-        if os.path.exists(dbf_path):
-            try:
-                with open(dbf_path, 'rb') as f:
-                    raw_data = f.read(10000)  # 读取前10000字节
-                    result = chardet.detect(raw_data)
-                    encoding = result['encoding'].lower() if result['encoding'] else 'utf-8'
-                    confidence = result['confidence']
-
-                    # 如果置信度高，直接使用
-                    if confidence > 0.7:
-                        if 'gb' in encoding or 'cp936' in encoding:
-                            return 'gbk'
-                        return encoding
-
-                    # 如果置信度低，尝试常见编码
-                    for enc in ['gbk', 'utf-8', 'cp936', 'latin1', 'mbcs']:
-                        try:
-                            with open(dbf_path, 'r', encoding=enc) as test:
-                                test.read(100)
-                            return enc
-                        except:
-                            continue
-            except:
-                pass
-
-        # 默认返回GBK（中国常用）
+def normalize_encoding(name):
+    """将.cpg内容或chardet结果规范为Python编码名，无法识别时返回None"""
+    name = name.strip().lower()
+    if name in ('gbk', 'gb2312', 'gb18030', 'cp936', '936', 'ansi', 'ansi 936'):
         return 'gbk'
-    except:
-        return 'gbk'  # 默认使用GBK
+    if name in ('utf-8', 'utf8', '65001'):
+        return 'utf-8'
+    if name in ('latin1', 'iso-8859-1', '8859_1'):
+        return 'latin1'
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def dbf_text_samples(dbf_data, limit=DBF_SAMPLE_VALUES):
+    """取出.dbf中含非ASCII字节的字段名和字符型字段值（最多limit个），用于编码解码测试
+
+    按字段描述定位字符型（C）字段，用numpy一次筛选全部记录中含非ASCII字节的值，不解析其它字段。
+    """
+    header_length = int.from_bytes(dbf_data[8:10], 'little')
+    record_length = int.from_bytes(dbf_data[10:12], 'little')
+    record_count = int.from_bytes(dbf_data[4:8], 'little')
+    samples = []
+    text_fields = []
+    field_offset = 1  # 每条记录第一个字节为删除标记
+    for offset in range(32, min(header_length, len(dbf_data)) - 1, 32):
+        descriptor = dbf_data[offset:offset + 32]
+        if len(descriptor) < 32 or descriptor[0] == 0x0D:
+            break
+        name = descriptor[:11].split(b'\x00', 1)[0]
+        if not name.isascii():
+            samples.append(name)
+        if descriptor[11:12] == b'C':
+            text_fields.append((field_offset, descriptor[16]))
+        field_offset += descriptor[16]
+
+    if record_length <= 0 or not text_fields:
+        return samples[:limit]
+    record_count = min(record_count, max(len(dbf_data) - header_length, 0) // record_length)
+    records = np.frombuffer(dbf_data, dtype=np.uint8, count=record_count * record_length,
+                            offset=header_length).reshape(record_count, record_length)
+    for field_offset, field_length in text_fields:
+        values = records[:, field_offset:field_offset + field_length]
+        for row in np.flatnonzero((values >= 0x80).any(axis=1))[:limit - len(samples)]:
+            samples.append(values[row].tobytes().rstrip(b' \x00'))
+        if len(samples) >= limit:
+            break
+    return samples
+
+
+def decodes_cleanly(samples, encoding):
+    """判断样本能否按编码无错误解码（字段宽度截断造成的末尾不完整字符不算错误）"""
+    try:
+        for sample in samples:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except (UnicodeDecodeError, LookupError):
+        return False
+    return True
+
+
+def plausible_encoding(samples, encoding):
+    """样本按编码可解码，且不是本应按UTF-8解码的文本（UTF-8中文大多也能按GBK解码，GBK中文几乎不可能是合法UTF-8）"""
+    if not decodes_cleanly(samples, encoding):
+        return False
+    return encoding == 'utf-8' or not samples or not decodes_cleanly(samples, 'utf-8')
+
+
+def detect_dbf_encoding(shp_members):
+    """分级检测属性表编码，返回 (编码, 检测依据)
+
+    依次使用：.cpg文件声明；.dbf文件头第29字节的语言驱动标记（LDID）；对字符型字段的解码测试（UTF-8、GBK）；
+    最后才用chardet。除纯ASCII外每一级的结果都经过解码测试验证。
+    不按生成软件缓存检测结果：样本已在内存中，验证缓存命中与直接做解码测试开销相同，
+    而不验证就沿用缓存会在多个软件生成的同一批文件中误判编码。
+    """
+    dbf_data = shp_members.get('.dbf')
+    samples = []
+    if dbf_data is not None and len(dbf_data) >= 32:
+        try:
+            samples = dbf_text_samples(dbf_data)
+        except Exception:
+            samples = []
+
+    # 1. .cpg文件声明的编码
+    cpg_data = shp_members.get('.cpg')
+    if cpg_data is not None:
+        encoding = normalize_encoding(cpg_data.decode('ascii', errors='ignore'))
+        if encoding is not None and decodes_cleanly(samples, encoding):
+            return encoding, ENCODING_SOURCE_CPG
+    if dbf_data is None or len(dbf_data) < 32:
+        return 'gbk', ENCODING_SOURCE_DEFAULT
+    if not samples:
+        return 'gbk', ENCODING_SOURCE_ASCII  # 没有非ASCII内容，GBK与UTF-8读取结果相同
+
+    # 2. 语言驱动标记
+    ldid = dbf_data[29]
+    encoding = DBF_LDID_ENCODINGS.get(ldid)
+    if encoding is not None and plausible_encoding(samples, encoding):
+        return encoding, ENCODING_SOURCE_LDID
+
+    # 3. 字符型字段解码测试
+    for encoding in ('utf-8', 'gbk'):
+        if decodes_cleanly(samples, encoding):
+            return encoding, ENCODING_SOURCE_DECODE
+
+    # 4. chardet（只检测字符型字段样本）
+    detected = chardet.detect(b'\n'.join(samples))
+    encoding = normalize_encoding(detected['encoding']) if detected['encoding'] else None
+    if encoding is not None and decodes_cleanly(samples, encoding):
+        return encoding, ENCODING_SOURCE_CHARDET
+    return 'gbk', ENCODING_SOURCE_DEFAULT
+
+
+def detect_encoding(shp_members):
+    """根据内存中的.cpg/.dbf内容检测属性表编码（见 detect_dbf_encoding）"""
+    return detect_dbf_encoding(shp_members)[0]
 
 
 def convert_timestamps_to_strings(gdf):
@@ -197,73 +322,492 @@ def convert_timestamps_to_strings(gdf):
     return gdf
 
 
-def extract_shp_from_zip(zip_path):
-    """解压zip文件，返回第一个shp文件路径和cpg存在状态"""
-    # 清理并创建临时目录
-    safe_remove_temp_dir()
-    os.makedirs(TEMP_DIR, exist_ok=True)
-
-    # 解压ZIP（处理中文文件名）
+def decode_zip_member_name(file_info):
+    """解码ZIP成员文件名：设置了UTF-8标记的直接使用，否则按原始字节依次尝试UTF-8、GBK（修复中文乱码）"""
+    if file_info.flag_bits & ZIP_UTF8_FLAG:
+        return file_info.filename
+    try:
+        raw_name = file_info.filename.encode('cp437')  # zipfile对未标记的文件名按cp437解码，还原为原始字节
+    except UnicodeEncodeError:
+        return file_info.filename
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            return raw_name.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return file_info.filename
+
+
+def is_zip_junk_member(name):
+    """判断是否为压缩软件附带的无关文件（macOS的__MACOSX目录和._资源文件）"""
+    parts = name.replace('\\', '/').split('/')
+    return '__MACOSX' in parts or parts[-1].startswith('._')
+
+
+def inspect_zip(zip_ref, shp_name=None):
+    """只读取ZIP中央目录，解码文件名并按文件名主干找出shp文件组，不解压任何成员
+
+    返回 {'shp_files'（ZIP中全部.shp的相对路径）, 'shp_name'（检查的.shp，未指定 shp_name 时为第一个）,
+    'members'（{扩展名: ZipInfo}，与.shp同名的组成文件，文件名主干不区分大小写）, 'extensions', 'cpg_exists'}。
+    """
+    members = [(decode_zip_member_name(info), info) for info in zip_ref.infolist()
+               if not info.is_dir()]
+    members = [(name, info) for name, info in members if not is_zip_junk_member(name)]
+    shp_files = [name for name, _ in members if name.lower().endswith('.shp')]
+    inspection = {'shp_files': shp_files, 'shp_name': None, 'members': {}, 'extensions': set(), 'cpg_exists': False}
+    if shp_name is None and shp_files:
+        shp_name = shp_files[0]
+    if shp_name not in shp_files:
+        return inspection
+
+    inspection['shp_name'] = shp_name
+    shp_stem = os.path.splitext(shp_name)[0].lower()
+    shp_dir = os.path.dirname(shp_name)
+    for name, info in members:
+        stem, ext = os.path.splitext(name)
+        if stem.lower() == shp_stem:
+            inspection['extensions'].add(ext.lower())
+            if ext.lower() in SHP_MEMBER_EXTENSIONS:
+                inspection['members'].setdefault(ext.lower(), info)
+        # shp所在目录下是否存在.cpg文件（不区分大小写）
+        if ext.lower() == '.cpg' and os.path.dirname(name) == shp_dir:
+            inspection['cpg_exists'] = True
+    return inspection
+
+
+def read_shp_from_zip(zip_path, shp_name=None):
+    """直接从zip读取一个shp文件组到内存（不解压到磁盘），只读取.shp及同名组成文件
+
+    shp_name 为ZIP中.shp的文件名（inspect_zip 返回的解码后名称），未指定时读取第一个。
+    返回shp相对路径、各组成文件内容、cpg存在状态和ZIP中全部.shp文件的相对路径。
+    zip_path 也可以是已读入内存的ZIP文件对象（如预读得到的 io.BytesIO）。
+    """
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        for file_info in zip_ref.infolist():
-            # 尝试修复中文文件名编码问题
-            try:
-                # 尝试用GBK解码（Windows常用）
-                file_info.filename = file_info.filename.encode('cp437').decode('gbk')
-            except:
-                try:
-                    # 尝试用UTF-8解码
-                    file_info.filename = file_info.filename.encode('cp437').decode('utf-8')
-                except:
-                    pass
-            zip_ref.extract(file_info, TEMP_DIR)
+        inspection = inspect_zip(zip_ref, shp_name)
+        if inspection['shp_name'] is None:
+            raise ValueError("未找到.shp文件" if shp_name is None else f"未找到{shp_name}")
+        shp_members = {ext: zip_ref.read(info) for ext, info in inspection['members'].items()}
+
+    shp_files = [os.path.normpath(name) for name in inspection['shp_files']]
+    return os.path.normpath(inspection['shp_name']), shp_members, inspection['cpg_exists'], shp_files
+
+
+def read_shp_header(header_data):
+    """解析.shp文件的100字节文件头，返回 (几何类型, 范围 (xmin, ymin, xmax, ymax))"""
+    if len(header_data) < SHP_HEADER_SIZE:
+        raise ValueError(".shp文件头不完整")
+    if int.from_bytes(header_data[0:4], 'big') != SHP_FILE_CODE:
+        raise ValueError(".shp文件头标识错误，不是有效的shp文件")
+    shape_type = int.from_bytes(header_data[32:36], 'little')
+    bbox = struct.unpack('<4d', header_data[36:68])
+    return SHP_SHAPE_TYPES.get(shape_type, 'unknown'), bbox
+
+
+def point_outside_extent(bbox, point):
+    """按.shp文件头的范围快速判断点是否明显在图层范围外（范围无效时返回False）"""
+    xmin, ymin, xmax, ymax = bbox
+    if not all(np.isfinite(bbox)) or xmin > xmax or ymin > ymax:
+        return False
+    return not (xmin <= point.x <= xmax and ymin <= point.y <= ymax)
+
+
+def precheck_zip(zip_path):
+    """快速预检查：只读取ZIP中央目录和.shp的100字节文件头，不解压、不解析几何
+
+    返回 {'shp_file_relative', 'shp_files'（ZIP中全部.shp）, 'extensions'（shp文件组中存在的扩展名）, 'cpg_exists',
+    'geometry_type', 'bbox', 'error'}。
+    """
+    info = {'shp_file_relative': None, 'shp_files': [], 'extensions': set(), 'cpg_exists': False,
+            'geometry_type': None, 'bbox': None, 'error': None}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        inspection = inspect_zip(zip_ref)
+        if inspection['shp_name'] is None:
+            info['error'] = "未找到.shp文件"
+            return info
+        info['shp_file_relative'] = os.path.normpath(inspection['shp_name'])
+        info['shp_files'] = [os.path.normpath(name) for name in inspection['shp_files']]
+        info['extensions'] = inspection['extensions']
+        info['cpg_exists'] = inspection['cpg_exists']
+        with zip_ref.open(inspection['members']['.shp']) as f:
+            header_data = f.read(SHP_HEADER_SIZE)
+    try:
+        info['geometry_type'], info['bbox'] = read_shp_header(header_data)
+    except ValueError as e:
+        info['error'] = str(e)
+    return info
+
+
+def read_dbf_field_names(dbf_data, encoding):
+    """只解析.dbf文件头中的字段描述，返回字段名列表（不读取记录）"""
+    header_length = int.from_bytes(dbf_data[8:10], 'little')
+    field_names = []
+    for offset in range(32, min(header_length, len(dbf_data)) - 1, 32):
+        descriptor = dbf_data[offset:offset + 32]
+        if len(descriptor) < 32 or descriptor[0] == 0x0D:  # 0x0D 为字段描述结束标志
+            break
+        field_names.append(descriptor[:11].split(b'\x00', 1)[0].decode(encoding, errors='replace').strip())
+    return field_names
+
+
+def resolve_read_engine(engine=None):
+    """确定读取shp使用的引擎，未指定时优先使用pyogrio（支持只读取指定字段和Arrow加速）"""
+    if engine:
+        return engine
+    try:
+        import pyogrio  # noqa: F401
+        return 'pyogrio'
+    except ImportError:
+        return 'fiona'
+
+
+def load_shp_layer(shp_members, encoding=None, all_columns=True, engine=None, use_arrow=False):
+    """一次读取shp文件组的几何和属性，返回 (GeoDataFrame, 使用的编码)
+
+    all_columns 为False时只读取检查需要的字段（地块名称/DKMC、DKDM/DKBM、XZQDM、XZQMC、YDMJ），
+    engine 为 pyogrio 或 fiona（默认优先pyogrio），use_arrow 为True时使用pyogrio的Arrow接口读取。
+    """
+    if encoding is None:
+        encoding = detect_encoding(shp_members)
+    engine = resolve_read_engine(engine)
+
+    kwargs = {'engine': engine}
+    if not all_columns and '.dbf' in shp_members:
+        columns = [name for name in read_dbf_field_names(shp_members['.dbf'], encoding)
+                   if name in REQUIRED_FIELD_NAMES]
+        kwargs['columns' if engine == 'pyogrio' else 'include_fields'] = columns
+    if use_arrow and engine == 'pyogrio':
+        kwargs['use_arrow'] = True
 
-    # 递归查找所有.shp文件（处理多层目录）
-    shp_files = glob.glob(os.path.join(TEMP_DIR, "**", "*.shp"), recursive=True)
+    try:
+        # 优先尝试指定编码
+        gdf = read_shp_members(shp_members, encoding, **kwargs)
+    except Exception:
+        if engine != 'fiona':
+            raise
+        # 如果失败，尝试使用errors='ignore'忽略编码错误（仅fiona支持）
+        gdf = read_shp_members(shp_members, encoding, errors='ignore', **kwargs)
+    return gdf, encoding
+
+
+def read_shp_members(shp_members, encoding, **kwargs):
+    """读取内存中的shp文件组，打包为仅含ASCII文件名的内存zip后交给GDAL读取"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for ext, data in shp_members.items():
+            archive.writestr('layer' + ext, data)
+    buffer.seek(0)
+    return gpd.read_file(buffer, encoding=encoding, **kwargs)
+
+
+def is_projection_crs(prj_data):
+    """根据.prj文件内容检查坐标系类型，增强检测能力"""
+    try:
+        prj_content = prj_data.decode('utf-8', errors='ignore').upper()
+
+        # 检查是否明确标识为投影坐标系
+        if "PROJCS" in prj_content:
+            coordinate_type = "Projection"
+            coordinate_system = prj_content.split('PROJCS["')[1].split('"')[
+                0] if 'PROJCS["' in prj_content else "Unknown"
+            return coordinate_type, coordinate_system
+
+        # 检查是否明确标识为地理坐标系
+        if "GEOGCS" in prj_content:
+            coordinate_type = "Geographic"
+            coordinate_system = prj_content.split('GEOGCS["')[1].split('"')[
+                0] if 'GEOGCS["' in prj_content else "Unknown"
+            return coordinate_type, coordinate_system
+
+        # 尝试通过坐标单位判断
+        if "UNIT[" in prj_content:
+            unit_info = prj_content.split("UNIT[")[1].split("]")[0]
+            if "DEGREE" in unit_info or "DEG" in unit_info:
+                return "Geographic", "Unknown Geographic System"
+            if "METER" in unit_info or "METRE" in unit_info:
+                return "Projection", "Unknown Projected System"
+
+        # 默认返回未知
+        return "Unknown", "Unknown Coordinate System"
+    except Exception as e:
+        return "Error", f"读取.prj文件出错: {str(e)}"
 
-    if not shp_files:
-        raise ValueError("未找到.shp文件")
 
-    # 检查.cpg文件是否存在（不区分大小写）
-    shp_dir = os.path.dirname(shp_files[0])
-    cpg_files = [f for f in os.listdir(shp_dir) if f.lower().endswith('.cpg')]
-    cpg_exists = len(cpg_files) > 0
+# 坐标系解析结果：kind 为 Projection/Geographic/Unknown/Error，epsg 为识别出的EPSG代码，
+# 高斯-克吕格投影时 zone_width 为分带宽度（3或6度）、zone 为带号、central_meridian 为中央经线
+CrsInfo = namedtuple('CrsInfo', ['kind', 'name', 'epsg', 'zone_width', 'zone', 'central_meridian'])
 
-    return shp_files[0], cpg_exists  # 只返回第一个找到的shp文件
 
+def _central_meridian(crs):
+    """返回投影坐标系的中央经线（没有时为None）"""
+    operation = crs.coordinate_operation
+    if operation is None:
+        return None
+    for param in operation.params:
+        if param.name.lower() in ('longitude of natural origin', 'central_meridian', 'longitude of origin'):
+            return param.value
+    return None
 
-def is_projection_crs(prj_file_path):
-    """检查坐标系类型，增强检测能力"""
-    try:
-        with open(prj_file_path, 'r', encoding='utf-8', errors='ignore') as prj_file:
-            prj_content = prj_file.read().upper()
-
-            # 检查是否明确标识为投影坐标系
-            if "PROJCS" in prj_content:
-                coordinate_type = "Projection"
-                coordinate_system = prj_content.split('PROJCS["')[1].split('"')[
-                    0] if 'PROJCS["' in prj_content else "Unknown"
-                return coordinate_type, coordinate_system
-
-            # 检查是否明确标识为地理坐标系
-            if "GEOGCS" in prj_content:
-                coordinate_type = "Geographic"
-                coordinate_system = prj_content.split('GEOGCS["')[1].split('"')[
-                    0] if 'GEOGCS["' in prj_content else "Unknown"
-                return coordinate_type, coordinate_system
-
-            # 尝试通过坐标单位判断
-            if "UNIT[" in prj_content:
-                unit_info = prj_content.split("UNIT[")[1].split("]")[0]
-                if "DEGREE" in unit_info or "DEG" in unit_info:
-                    return "Geographic", "Unknown Geographic System"
-                if "METER" in unit_info or "METRE" in unit_info:
-                    return "Projection", "Unknown Projected System"
-
-            # 默认返回未知
-            return "Unknown", "Unknown Coordinate System"
-    except Exception as e:
-        return "Error", f"读取.prj文件出错: {str(e)}"
+
+def _gauss_kruger_zone(crs, central_meridian):
+    """返回CGCS2000高斯-克吕格投影的 (分带宽度, 带号)，不是时返回 (None, None)"""
+    datum_name = crs.geodetic_crs.name.upper()
+    if central_meridian is None or ('CHINA' not in datum_name and 'CGCS2000' not in datum_name):
+        return None, None
+    if crs.coordinate_operation.method_name.lower() != 'transverse mercator':
+        return None, None
+    name = crs.name.upper()
+    if re.search(r'3[-_ ]?DEGREE', name) or central_meridian % 6 != 3:
+        zone_width = 3
+    else:
+        zone_width = 6
+    match = re.search(r'ZONE[_ ]?(\d+)', name)
+    if match:
+        return zone_width, int(match.group(1))
+    zone = central_meridian / 3 if zone_width == 3 else (central_meridian + 3) / 6
+    return zone_width, int(zone) if float(zone).is_integer() else None
+
+
+_crs_info_memo = {}  # .prj文件内容的SHA-1 -> CrsInfo
+_crs_info_stats = Counter()  # 坐标系解析缓存的命中/未命中次数
+
+
+def classify_crs(prj_data, crs=None):
+    """由GeoPandas读取图层时解析得到的坐标系对象 crs 生成 CrsInfo，按.prj文件内容的哈希缓存（相同的.prj只分类一次）
+
+    分类的就是后续坐标转换使用的坐标系，两者不会不一致；crs 为None（GDAL无法解析.prj）时退回按WKT文本判断
+    （is_projection_crs），此时没有EPSG代码和分带信息。
+    """
+    key = hashlib.sha1(prj_data).digest()
+    crs_info = _crs_info_memo.get(key)
+    if crs_info is not None:
+        _crs_info_stats['hits'] += 1
+        return crs_info
+    _crs_info_stats['misses'] += 1
+    crs_info = _classify_parsed_crs(prj_data, crs)
+    if len(_crs_info_memo) >= CRS_INFO_CACHE_SIZE:
+        _crs_info_memo.pop(next(iter(_crs_info_memo)), None)  # 超出上限时丢弃最早缓存的.prj
+    _crs_info_memo[key] = crs_info
+    return crs_info
+
+
+def _classify_parsed_crs(prj_data, crs):
+    """对已解析的坐标系对象分类，返回 CrsInfo"""
+    if crs is None:
+        kind, name = is_projection_crs(prj_data)
+        return CrsInfo(kind, name, None, None, None, None)
+    if crs.is_projected:
+        kind = "Projection"
+    elif crs.is_geographic:
+        kind = "Geographic"
+    else:
+        kind = "Unknown"
+    central_meridian = _central_meridian(crs) if crs.is_projected else None
+    zone_width, zone = _gauss_kruger_zone(crs, central_meridian) if crs.is_projected else (None, None)
+    return CrsInfo(kind, crs.name, crs.to_epsg(), zone_width, zone, central_meridian)
+
+
+def format_crs(crs_info):
+    """生成result工作表crs列的文字：坐标系名称、EPSG代码和投影信息（高斯-克吕格分带、中央经线）"""
+    details = []
+    if crs_info.epsg is not None:
+        details.append(f"EPSG:{crs_info.epsg}")
+    if crs_info.zone is not None:
+        details.append(f"{crs_info.zone_width}度带第{crs_info.zone}带")
+    if crs_info.central_meridian is not None:
+        details.append(f"中央经线{crs_info.central_meridian:g}°")
+    return f"{crs_info.name} ({'，'.join(details)})" if details else crs_info.name
+
+
+def crs_cache_stats():
+    """返回坐标系解析缓存的命中/未命中次数和当前大小"""
+    return {'hits': _crs_info_stats['hits'], 'misses': _crs_info_stats['misses'], 'size': len(_crs_info_memo),
+            'maxsize': CRS_INFO_CACHE_SIZE}
+
+
+@lru_cache(maxsize=TRANSFORMER_CACHE_SIZE)
+def get_transformer(source_crs, target_crs):
+    """按 (源坐标系, 目标坐标系) 缓存pyproj坐标转换器，避免每个ZIP重复创建"""
+    return Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+
+def transformer_cache_stats():
+    """返回坐标转换器缓存的命中/未命中次数和当前大小"""
+    info = get_transformer.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+
+
+def cache_counters():
+    """返回本进程坐标转换器缓存和坐标系解析缓存的累计统计 {缓存名: {hits, misses, size, maxsize}}"""
+    return {'transformer_cache': transformer_cache_stats(), 'crs_cache': crs_cache_stats()}
+
+
+def cache_counters_delta(before, after):
+    """返回两次 cache_counters() 之间的命中/未命中次数增量，size 为之后的缓存大小"""
+    return {name: dict(after[name], hits=after[name]['hits'] - before[name]['hits'],
+                       misses=after[name]['misses'] - before[name]['misses'])
+            for name in after}
+
+
+def add_cache_counters(total, delta):
+    """将缓存统计增量累加到 total：命中/未命中次数相加，size 取各进程中最大的缓存大小"""
+    for name, stats in delta.items():
+        if name not in total:
+            total[name] = dict(stats)
+            continue
+        total[name]['hits'] += stats['hits']
+        total[name]['misses'] += stats['misses']
+        total[name]['size'] = max(total[name]['size'], stats['size'])
+
+
+def transform_point(point, source_crs, target_crs):
+    """使用缓存的坐标转换器转换单个点"""
+    if source_crs is None or target_crs is None:
+        raise ValueError("shp文件未定义坐标系")
+    x, y = get_transformer(source_crs, target_crs).transform(point.x, point.y)
+    return Point(x, y)
+
+
+def point_in_layer(gdf, point):
+    """使用图层的空间索引（STRtree）一次查询判断点是否落在任一要素内"""
+    return gdf.sindex.query(point, predicate='within').size > 0
+
+
+def check_geometry_validity(geometries):
+    """向量化检查图层所有要素的几何有效性（一次调用处理全部要素）
+
+    返回 {'missing'/'empty'/'invalid'/'zero_area': 要素掩码, 'reasons': 无效原因计数}，
+    零面积只统计有效的非空面要素，无效原因去掉了坐标位置（如 Self-intersection[x y]）。
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    missing = shapely.is_missing(geometries)
+    empty = shapely.is_empty(geometries)
+    invalid = ~shapely.is_valid(geometries) & ~missing
+    polygonal = np.isin(shapely.get_type_id(geometries), (3, 6))  # Polygon、MultiPolygon
+    zero_area = polygonal & ~empty & ~invalid & (shapely.area(geometries) == 0)
+    reasons = Counter(reason.split('[', 1)[0].strip() for reason in shapely.is_valid_reason(geometries[invalid]))
+    return {'missing': missing, 'empty': empty, 'invalid': invalid, 'zero_area': zero_area, 'reasons': reasons}
+
+
+def repair_geometries(geometries, mask):
+    """用make_valid修复掩码内的几何，修复结果只保留面部分（退化为线、点的部分丢弃），返回新的几何数组"""
+    repaired = np.array(geometries, dtype=object)
+    fixed = shapely.make_valid(repaired[mask])
+    for i in np.flatnonzero(shapely.get_type_id(fixed) == 7):  # GeometryCollection
+        parts = shapely.get_parts(fixed[i])
+        fixed[i] = shapely.union_all(parts[np.isin(shapely.get_type_id(parts), (3, 6))])
+    repaired[mask] = fixed
+    return repaired
+
+
+def layer_representative_point(geometries, method=SUGGEST_POINT_CENTROID):
+    """向量化计算图层的代表点（不合并要素），返回图层坐标系下的 (x, y)
+
+    centroid 为各要素中心点按面积加权的平均（要素互不重叠时等于合并后图形的中心点，线、点图层按长度或个数加权）；
+    point_on_surface 为面积最大要素内的点，保证落在图层的面内。
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    weights = np.nan_to_num(shapely.area(geometries))
+    if not weights.sum() > 0:
+        weights = np.nan_to_num(shapely.length(geometries))
+    if not weights.sum() > 0:
+        weights = (~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)).astype(float)
+    if not weights.sum() > 0:
+        raise ValueError("图层没有非空要素")
+    if method == SUGGEST_POINT_SURFACE:
+        point = shapely.point_on_surface(geometries[np.argmax(weights)])
+        return float(point.x), float(point.y)
+    selected = weights > 0
+    centroids = shapely.centroid(geometries[selected])
+    return (float(np.average(shapely.get_x(centroids), weights=weights[selected])),
+            float(np.average(shapely.get_y(centroids), weights=weights[selected])))
+
+
+def suggested_coordinates(points):
+    """按坐标系分组将图层坐标系下的代表点批量转换为CGCS2000经纬度，每个坐标系只调用一次坐标转换
+
+    points 为 [(x, y, 坐标系WKT), ...]；坐标值已在经纬度范围内的点视为实际为地理坐标，不转换。
+    返回 (经度数组, 纬度数组)，转换失败的点为NaN。
+    """
+    xs = np.array([point[0] for point in points], dtype=float)
+    ys = np.array([point[1] for point in points], dtype=float)
+    lons, lats = xs.copy(), ys.copy()
+    groups = defaultdict(list)
+    for position, (x, y, crs) in enumerate(points):
+        if not (-180 <= x <= 180 and -90 <= y <= 90):
+            groups[crs].append(position)
+    for crs, positions in groups.items():
+        try:
+            lons[positions], lats[positions] = get_transformer(crs, "EPSG:4490").transform(xs[positions], ys[positions])
+        except Exception as e:
+            print(f"建议坐标转换失败: {str(e)}")
+            lons[positions] = lats[positions] = np.nan
+    return lons, lats
+
+
+def convert_suggested_points(suggested_points, cache_stats=None):
+    """批量转换未通过地块的建议坐标，返回 [(键, 追加的问题, {经度new/纬度new: 值}), ...]
+
+    suggested_points 为 [(键, 图层坐标系下的代表点), ...]，键为结果序号或结果记录，原样返回。
+    cache_stats 为字典时，本次转换的坐标转换器缓存命中次数累加到其中。
+    """
+    if not suggested_points:
+        return []
+    counters = cache_counters()
+    lons, lats = suggested_coordinates([point for _, point in suggested_points])
+    if cache_stats is not None:
+        add_cache_counters(cache_stats, cache_counters_delta(counters, cache_counters()))
+    converted = []
+    for (key, _), lon, lat in zip(suggested_points, lons, lats):
+        if not (np.isfinite(lon) and np.isfinite(lat)):
+            converted.append((key, [(Issue.CENTROID_ERROR, None)], {}))
+            continue
+        abnormal = not (-180 <= lon <= 180 and -90 <= lat <= 90)
+        converted.append((key, [(Issue.NEW_COORD_ABNORMAL, None)] if abnormal else [],
+                          {'经度new': round(float(lon), 6), '纬度new': round(float(lat), 6)}))
+    return converted
+
+
+def check_declared_points(declared_df, boundary_layers):
+    """批量检查地块信息中每个申报坐标是否落在其地块编码对应的边界图层内
+
+    declared_df 为地块信息表（含地块编码、经度、纬度列），boundary_layers 为 {地块编码: GeoDataFrame}。
+    按图层坐标系分组，每组只做一次坐标转换并对所有要素建立一棵STRtree，一次批量查询完成判断。
+    返回与 declared_df 行索引对齐的 Series：True/False，无对应边界或无坐标系的地块为空值。
+    """
+    inside = pd.Series(None, index=declared_df.index, dtype=object)
+    codes = declared_df['地块编码'].astype(str).str.strip()
+
+    # 按坐标系分组：记录每个要素所属的申报行
+    groups = defaultdict(lambda: ([], []))  # crs -> (要素几何列表, 所属行号列表)
+    for position, code in enumerate(codes):
+        gdf = boundary_layers.get(code)
+        if gdf is None or gdf.crs is None or gdf.empty:
+            continue
+        geometries, owners = groups[gdf.crs]
+        geometries.extend(gdf.geometry.values)
+        owners.extend([position] * len(gdf))
+
+    lons = declared_df['经度'].to_numpy(dtype=float)
+    lats = declared_df['纬度'].to_numpy(dtype=float)
+    for crs, (geometries, owners) in groups.items():
+        owners = np.asarray(owners)
+        positions = np.unique(owners)
+
+        # 申报坐标为CGCS2000地理坐标，整组一次转换到图层坐标系
+        transformer = get_transformer("EPSG:4490", crs)
+        xs, ys = transformer.transform(lons[positions], lats[positions])
+        points = shapely.points(xs, ys)
+
+        # 一次批量查询：返回 (点序号, 要素序号) 对，只保留要素属于该点自身地块的结果
+        tree = shapely.STRtree(geometries)
+        point_idx, geom_idx = tree.query(points, predicate='within')
+        hit_positions = positions[point_idx[owners[geom_idx] == positions[point_idx]]]
+
+        group_result = pd.Series(False, index=positions)
+        group_result[np.unique(hit_positions)] = True
+        inside.iloc[positions] = group_result.to_numpy(dtype=object)
+
+    return inside
 
 
 def style_function(feature):
@@ -309,6 +853,68 @@ def show_dataframe_in_window(df, window_title="边界文件检查结果"):
     root.mainloop()
 
 
+def run_with_progress_window(run_kwargs):
+    """在后台线程中运行检查并显示进度窗口，窗口在检查期间保持响应
+
+    返回 {'summary': 检查统计} 或 {'exit_code': 退出码}（输入错误）或 {'error': 错误信息}。
+    """
+    root = tk.Tk()
+    root.title("边界文件检查进度")
+    root.geometry("520x150")
+
+    status_var = tk.StringVar(value="正在准备检查任务...")
+    detail_var = tk.StringVar(value="")
+    tk.Label(root, textvariable=status_var, anchor="w").pack(fill="x", padx=15, pady=(15, 5))
+    progress_bar = ttk.Progressbar(root, mode="determinate", maximum=1)
+    progress_bar.pack(fill="x", padx=15, pady=5)
+    tk.Label(root, textvariable=detail_var, anchor="w").pack(fill="x", padx=15, pady=5)
+    # 检查不能中途取消，关闭按钮只最小化窗口
+    root.protocol("WM_DELETE_WINDOW", root.iconify)
+
+    events = queue.Queue()
+    outcome = {}
+
+    def worker():
+        try:
+            outcome['summary'] = run_boundary_check(**run_kwargs, show_gui=False, progress_callback=events.put)
+        except SystemExit as e:
+            outcome['exit_code'] = e.code
+        except Exception:
+            outcome['error'] = traceback.format_exc()
+        finally:
+            events.put(None)
+
+    def poll_events():
+        latest, finished = None, False
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                finished = True
+            else:
+                latest = event
+        if latest is not None:
+            progress_bar.configure(maximum=max(latest['total'], 1), value=latest['done'])
+            status_var.set(format_progress_text(latest))
+            if latest['done'] >= latest['total']:
+                detail_var.set("检查完成，正在保存Excel结果和地图...")
+            else:
+                detail_var.set(f"当前：{latest['zip_file']}" if latest['zip_file'] else "")
+        if finished:
+            root.destroy()
+        else:
+            root.after(100, poll_events)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    root.after(100, poll_events)
+    root.mainloop()
+    thread.join()
+    return outcome
+
+
 def extract_land_block_code(filename):
     """从文件名中提取13位地块编码"""
     # 匹配13位连续数字（前后不能是数字）
@@ -318,437 +924,1824 @@ def extract_land_block_code(filename):
     return None
 
 
-def main():
-    # 选择文件夹
-    folder_path = select_folder_path()
-    excel_file = os.path.join(folder_path, "地块信息.xlsx")
+class Issue(enum.Enum):
+    """检查发现的问题类型，值为写入result列的说明文字"""
+    LAND_BLOCK_NOT_FOUND = '地块信息中未找到该地块编码'
+    DUPLICATE_LAND_BLOCK_CODE = '地块信息中地块编码重复'
+    EXTRACT_ERROR = '解压错误'
+    CPG_MISSING = 'cpg文件缺失'
+    READ_ERROR = 'shp读取错误'
+    NO_GEOMETRY = 'SHP文件无有效几何数据'
+    GEOMETRY_TYPE = '几何类型错误'
+    INVALID_GEOMETRY = '边界几何无效'
+    EMPTY_GEOMETRY = '存在空几何或零面积要素'
+    FIELD_MISSING = '字段缺失'
+    FIELD_EMPTY = '字段内容为空'
+    GEOGRAPHIC_CRS = '地理坐标系（注意：应使用投影坐标系）'
+    PRJ_MISSING = '坐标系文件缺失'
+    CRS_TRANSFORM_ERROR = '坐标系转换失败'
+    OUTSIDE_BOUNDARY = '地块位置不在边界范围内'
+    NEW_COORD_ABNORMAL = '新坐标计算异常'
+    CENTROID_ERROR = '中心点坐标计算失败'
+    CONTAINMENT_UNCHECKED = '无法检查点是否在多边形内（无有效几何数据）'
+    PROCESS_ERROR = '处理错误'
+    PARCEL_OVERLAP = '与其他地块边界重叠'
+    DUPLICATE_GEOMETRY = '与其他地块边界完全相同'
+
+
+# 只对主边界图层报告的问题（附属图层不做申报坐标相关的检查）
+BOUNDARY_LAYER_ISSUES = {Issue.OUTSIDE_BOUNDARY, Issue.CENTROID_ERROR, Issue.NEW_COORD_ABNORMAL,
+                         Issue.CONTAINMENT_UNCHECKED}
+PASS_STATS_NAME = 'PASS地块数量'
+# 统计信息中的问题分类：统计项 -> 计入该项的问题类型
+ISSUE_STATS = [
+    ('未对应地块编码的zip数量', {Issue.LAND_BLOCK_NOT_FOUND}),
+    ('cpg文件缺失的数量', {Issue.CPG_MISSING}),
+    ('字段问题的数量', {Issue.FIELD_MISSING, Issue.FIELD_EMPTY}),
+    ('几何类型错误的数量', {Issue.GEOMETRY_TYPE}),
+    ('几何无效的数量', {Issue.INVALID_GEOMETRY, Issue.EMPTY_GEOMETRY}),
+    ('坐标系问题的数量', {Issue.PRJ_MISSING, Issue.GEOGRAPHIC_CRS}),
+    ('地块位置不在边界范围的数量', {Issue.OUTSIDE_BOUNDARY}),
+    ('边界重叠或重复的数量', {Issue.PARCEL_OVERLAP, Issue.DUPLICATE_GEOMETRY}),
+]
+# 必要字段（支持中英文）：字段说明 -> 可接受的字段名
+REQUIRED_FIELDS_MAPPING = {
+    '地块名称': ['地块名称', 'DKMC', 'dkmc'],
+    '地块代码': ['地块代码', 'DKDM', 'DKBM', 'dkdm', 'dkbm'],
+    '行政区代码': ['行政区代码', 'XZQDM', 'xzqdm'],
+    '行政区名称': ['行政区名称', 'XZQMC', 'xzqmc'],
+    '地块面积': ['地块面积', 'YDMJ', 'ydmj']
+}
+REQUIRED_FIELD_NAMES = {name for names in REQUIRED_FIELDS_MAPPING.values() for name in names}
+RESULT_COLUMNS = [
+    'zip_file_name', 'shp_file_relative', 'layer_role', '地块编码', '地块名称', '经度', '纬度',
+    'cpg', 'encoding', 'encoding_source', 'polygon', 'validity', 'field', 'field_content', 'crs', 'In_polygon',
+    '经度new', '纬度new', 'overlap', 'result'
+]
+OVERLAP_COLUMNS = ['zip_file_name_a', '地块编码_a', 'zip_file_name_b', '地块编码_b', '类型', '重叠面积(平方米)', '占较小地块面积比例']
+ZIP_TIMING_COLUMNS = [f"time_{name}_s" for name in ZIP_TIMING_STAGES] + ['time_total_s']  # 单个ZIP各阶段耗时（秒）
+
+
+def format_issues(issues):
+    """将问题列表汇总为result字段文字，无问题时为pass"""
+    if not issues:
+        return "pass"
+    return " | ".join(issue.value if detail is None else f"{issue.value}: {detail}" for issue, detail in issues)
+
+
+class ResultTable:
+    """检查结果累加器：按列收集结果记录，最后一次性生成DataFrame，避免逐行pd.concat"""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.data = {col: [] for col in self.columns}
+        self.issues = []
+
+    def __len__(self):
+        return len(self.issues)
+
+    def append(self, result_dict):
+        """添加一条结果记录（含issues问题列表），记录中出现的新字段追加为新列"""
+        for col in result_dict:
+            if col not in self.data and col != 'issues':
+                self.columns.append(col)
+                self.data[col] = [None] * len(self.issues)
+        for col in self.columns:
+            if col != 'result':
+                self.data[col].append(result_dict.get(col))
+        self.issues.append(result_dict.get('issues', []))
+
+    def add_issues(self, index, issues, **values):
+        """为已添加的第index条结果记录追加问题和字段值（如所有ZIP检查完成后的跨地块检查结果）"""
+        for col, value in values.items():
+            if col not in self.data:
+                self.columns.append(col)
+                self.data[col] = [None] * len(self.issues)
+            self.data[col][index] = value
+        self.issues[index] = self.issues[index] + list(issues)
+
+    def fill_default(self, indexes, **values):
+        """为指定的多条结果记录设置字段值（随后add_issues写入的值优先）"""
+        for col, value in values.items():
+            if col not in self.data:
+                self.columns.append(col)
+                self.data[col] = [None] * len(self.issues)
+            column = self.data[col]
+            for index in indexes:
+                column[index] = value
+
+    def to_dataframe(self):
+        """生成结果DataFrame，result列由问题列表汇总生成"""
+        self.data['result'] = [format_issues(issues) for issues in self.issues]
+        return pd.DataFrame(self.data, columns=self.columns)
+
+    def summary_counts(self):
+        """一次遍历统计通过数量和各类问题数量，返回 {统计项: 数量}"""
+        counts = Counter()
+        for issues in self.issues:
+            count_issue_stats(counts, issues)
+        return {name: counts[name] for name in [PASS_STATS_NAME] + [name for name, _ in ISSUE_STATS]}
+
+
+def count_issue_stats(counts, issues):
+    """将一条结果记录的问题计入统计项计数"""
+    kinds = {issue for issue, _ in issues}
+    if not kinds:
+        counts[PASS_STATS_NAME] += 1
+    for stats_name, stats_kinds in ISSUE_STATS:
+        if kinds & stats_kinds:
+            counts[stats_name] += 1
+
+
+class ResultSpool:
+    """流式检查结果累加器：结果记录按块写入磁盘临时文件，内存中只保留一块和每条记录的问题类型
+
+    与 ResultTable 接口相同（append、add_issues、fill_default、summary_counts、__len__），写出Excel时用 iter_rows() 逐行读回。
+    """
+
+    def __init__(self, columns, chunk_size=STREAM_CHUNK_SIZE):
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.issue_kinds = []  # 每条记录的问题类型集合，用于统计
+        self.updates = {}  # 写入后追加的问题和字段值 {序号: (问题列表, {列: 值})}
+        self.defaults = {}  # 多条记录共用的字段值 {列: (值, 每条记录是否使用的标记)}，读回时合并
+        self.spool_file = tempfile.TemporaryFile('w+', encoding='utf-8')
+
+    def __len__(self):
+        return len(self.issue_kinds)
+
+    def append(self, result_dict):
+        """添加一条结果记录，缓冲满一块后写入临时文件"""
+        for col in result_dict:
+            if col not in self.columns and col != 'issues':
+                self.columns.append(col)
+        issues = result_dict.get('issues', [])
+        self.issue_kinds.append({issue for issue, _ in issues})
+        row = dict(result_dict, issues=[(issue.name, detail) for issue, detail in issues])
+        self.buffer.append(row)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def add_issues(self, index, issues, **values):
+        """为第index条结果记录追加问题和字段值（读回时合并）"""
+        for col in values:
+            if col not in self.columns:
+                self.columns.append(col)
+        pending_issues, pending_values = self.updates.setdefault(index, ([], {}))
+        pending_issues.extend(issues)
+        pending_values.update(values)
+        self.issue_kinds[index] |= {issue for issue, _ in issues}
+
+    def fill_default(self, indexes, **values):
+        """为指定的多条结果记录设置字段值，只保存每条记录一个字节的标记（读回时合并，add_issues的值优先）"""
+        mask = bytearray(len(self))
+        for index in indexes:
+            mask[index] = 1
+        for col, value in values.items():
+            if col not in self.columns:
+                self.columns.append(col)
+            self.defaults[col] = (value, mask)
+
+    def flush(self):
+        """将缓冲的结果记录写入临时文件"""
+        for row in self.buffer:
+            self.spool_file.write(json.dumps(row, ensure_ascii=False, default=_to_json_value) + "\n")
+        self.buffer = []
+
+    def iter_rows(self, columns=None):
+        """按写入顺序逐行读回结果记录，返回按列顺序排列的值列表，result列在此时生成"""
+        columns = self.columns if columns is None else columns
+        self.flush()
+        self.spool_file.seek(0)
+        for index, line in enumerate(self.spool_file):
+            row = json.loads(line)
+            issues = [(Issue[name], detail) for name, detail in row['issues']]
+            for col, (value, mask) in self.defaults.items():
+                if mask[index]:
+                    row[col] = value
+            if index in self.updates:
+                extra_issues, extra_values = self.updates[index]
+                issues += extra_issues
+                row.update(extra_values)
+            row['result'] = format_issues(issues)
+            yield [row.get(col) for col in columns]
+        self.spool_file.seek(0, os.SEEK_END)
+
+    def to_dataframe(self, columns=None):
+        """读回指定列生成DataFrame（只在需要少数列时使用，如耗时汇总）"""
+        columns = [col for col in (self.columns if columns is None else columns) if col in self.columns]
+        return pd.DataFrame(list(self.iter_rows(columns)), columns=columns)
+
+    def summary_counts(self):
+        """统计通过数量和各类问题数量，返回 {统计项: 数量}"""
+        counts = Counter()
+        for kinds in self.issue_kinds:
+            count_issue_stats(counts, [(issue, None) for issue in kinds])
+        return {name: counts[name] for name in [PASS_STATS_NAME] + [name for name, _ in ISSUE_STATS]}
+
+    def close(self):
+        self.spool_file.close()
+
+
+class StageTimer:
+    """分阶段计时器：累计各阶段耗时（秒），trace_memory为True时同时记录各阶段的tracemalloc峰值内存"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory and tracemalloc.is_tracing()
+        self.seconds = {}
+        self.peak_memory = {}
+        self.started = self.last_mark = time.perf_counter()
+
+    def add(self, name, seconds):
+        """累加某阶段的耗时"""
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """计时一个代码块，同名阶段的耗时累加"""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            self._record_peak_memory(name)
+            self.last_mark = time.perf_counter()
+
+    def lap(self, name):
+        """将上次计时点到现在的耗时记入某阶段（用于顺序执行、中途可能返回的流程）"""
+        now = time.perf_counter()
+        self.add(name, now - self.last_mark)
+        self._record_peak_memory(name)
+        self.last_mark = now
+
+    def _record_peak_memory(self, name):
+        """记录上次重置以来的峰值内存并重置峰值"""
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peak_memory[name] = max(self.peak_memory.get(name, 0), peak)
+            tracemalloc.reset_peak()
+
+    def elapsed(self):
+        """返回从创建计时器到现在的总耗时"""
+        return time.perf_counter() - self.started
+
+    def as_columns(self, stages):
+        """返回写入result工作表的耗时列 {time_阶段_s: 秒}，未执行的阶段为空（列名同 ZIP_TIMING_COLUMNS）"""
+        columns = {f"time_{name}_s": round(self.seconds[name], 4) if name in self.seconds else None
+                   for name in stages}
+        columns['time_total_s'] = round(self.elapsed(), 4)
+        return columns
+
+
+def format_duration(seconds):
+    """将秒数格式化为 时:分:秒 或 分:秒"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def format_progress_text(event):
+    """将进度事件格式化为一行文字：完成数量、百分比、吞吐量和预计剩余时间"""
+    percent = event['done'] / event['total'] * 100 if event['total'] else 100.0
+    text = f"{event['done']}/{event['total']} ({percent:.1f}%)"
+    if event['rate']:
+        text += f"，{event['rate']:.1f} 个/秒"
+    if event['eta'] is not None:
+        text += f"，预计剩余 {format_duration(event['eta'])}"
+    return text + f"，已用 {format_duration(event['elapsed'])}"
+
+
+class ProgressTracker:
+    """检查进度跟踪：统计完成的ZIP数量，按最近完成的ZIP计算滚动吞吐量和预计剩余时间，并发送进度事件
+
+    进度事件为字典：done 已完成数量、total 总数、zip_file 刚完成的ZIP、elapsed 已用秒数、
+    rate 滚动吞吐量（个/秒，尚无法计算时为None）、eta 预计剩余秒数（尚无法计算时为None）。
+    """
+
+    def __init__(self, total, callback, window=PROGRESS_RATE_WINDOW):
+        self.total = total
+        self.callback = callback
+        self.done = 0
+        self.started = time.perf_counter()
+        self.recent = deque([(self.started, 0)], maxlen=window + 1)  # 最近的 (完成时间, 完成数量)
+        self.callback(self._event(None, self.started))
+
+    def update(self, zip_file):
+        """记录一个ZIP完成并发送进度事件"""
+        now = time.perf_counter()
+        self.done += 1
+        self.recent.append((now, self.done))
+        self.callback(self._event(zip_file, now))
+
+    def _event(self, zip_file, now):
+        rate = eta = None
+        first_time, first_done = self.recent[0]
+        if self.done > first_done and now > first_time:
+            rate = (self.done - first_done) / (now - first_time)
+            eta = (self.total - self.done) / rate
+        return {'done': self.done, 'total': self.total, 'zip_file': zip_file,
+                'elapsed': now - self.started, 'rate': rate, 'eta': eta}
+
+
+class ConsoleProgress:
+    """在终端显示进度条（输出到stderr）；输出重定向到文件时改为每隔一段时间输出一行进度"""
+
+    def __init__(self, stream=None, width=30):
+        self.stream = stream if stream is not None else sys.stderr
+        self.width = width
+        self.interactive = self.stream is not None and self.stream.isatty()
+        self.last_output = 0.0
+
+    def __call__(self, event):
+        if self.stream is None:
+            return
+        finished = event['done'] >= event['total']
+        now = time.perf_counter()
+        interval = PROGRESS_REFRESH_SECONDS if self.interactive else PROGRESS_LOG_SECONDS
+        if not finished and event['done'] > 0 and now - self.last_output < interval:
+            return
+        if not self.interactive and event['done'] == 0:
+            return
+        self.last_output = now
+
+        text = format_progress_text(event)
+        if self.interactive:
+            filled = self.width * event['done'] // event['total'] if event['total'] else self.width
+            bar = '#' * filled + '-' * (self.width - filled)
+            current = f" {event['zip_file']}" if event['zip_file'] and not finished else ""
+            self.stream.write(f"\r\033[K[{bar}] {text}{current}")
+            if finished:
+                self.stream.write("\n")
+        else:
+            self.stream.write(f"进度：{text}\n")
+        self.stream.flush()
+
+
+def summarize_zip_timings(result_df, stages):
+    """汇总result表中各ZIP的分阶段耗时，返回 (各阶段汇总, 最慢的ZIP列表)"""
+    stage_summary = {}
+    for name in stages + ['total']:
+        column = f"time_{name}_s"
+        if column not in result_df.columns:
+            continue
+        values = pd.to_numeric(result_df[column], errors='coerce')
+        if values.notna().sum() == 0:
+            continue
+        slowest = values.idxmax()
+        stage_summary[name] = {
+            'count': int(values.notna().sum()),
+            'total_s': round(float(values.sum()), 4),
+            'mean_ms': round(float(values.mean()) * 1000, 3),
+            'max_s': round(float(values.max()), 4),
+            'max_zip': result_df.at[slowest, 'zip_file_name'],
+        }
+
+    slowest_zips = []
+    if 'time_total_s' in result_df.columns:
+        totals = pd.to_numeric(result_df['time_total_s'], errors='coerce').dropna().nlargest(10)
+        slowest_zips = [{'zip_file_name': result_df.at[index, 'zip_file_name'], 'time_total_s': round(float(value), 4)}
+                        for index, value in totals.items()]
+    return stage_summary, slowest_zips
+
+
+def build_land_block_index(original_df):
+    """按地块编码建立哈希索引，返回 ({地块编码: 第一行地块信息}, {重复的地块编码: 出现次数})"""
+    codes = original_df['地块编码']
+    first_rows = original_df[~codes.duplicated(keep='first')]
+    land_block_index = dict(zip(first_rows['地块编码'], first_rows.to_dict('records')))
 
-    # 初始化统计变量
-    pass_count = 0
-    not_found_count = 0
-    cpg_missing_count = 0
-    field_missing_count = 0
-    geometry_error_count = 0
-    crs_error_count = 0
-    in_polygon_count = 0
+    duplicated = codes[codes.duplicated(keep=False)]
+    duplicate_codes = duplicated.value_counts(sort=False).to_dict()
+    return land_block_index, duplicate_codes
 
+
+def load_land_block_info(excel_file):
+    """读取地块信息表并按地块编码建立索引，返回 (地块信息DataFrame, {地块编码: 第一行地块信息}, {重复的地块编码: 出现次数})
+
+    文件不存在、读取失败或缺少必要列时输出错误并以 EXIT_ERROR 退出。
+    """
     # 检查Excel文件是否存在
     if not os.path.exists(excel_file):
-        print(f"错误：地块信息.xlsx文件不存在于 {folder_path}")
-        sys.exit()
+        print(f"错误：地块信息.xlsx文件不存在: {excel_file}")
+        sys.exit(EXIT_ERROR)
 
     # 读取原始地块信息
     try:
         original_df = pd.read_excel(excel_file)
         # 确保地块编码列为字符串类型，并去除空格
         original_df['地块编码'] = original_df['地块编码'].astype(str).str.strip()
-        total_land_blocks = len(original_df)
-        # print(f"地块信息Excel中共有 {total_land_blocks} 个地块编码")
     except Exception as e:
         print(f"读取地块信息.xlsx失败: {e}")
-        sys.exit()
+        sys.exit(EXIT_ERROR)
 
     # 确保必要列存在
     required_columns = ['地块编码', '经度', '纬度']
     missing_cols = [col for col in required_columns if col not in original_df.columns]
     if missing_cols:
         print(f"错误：地块信息.xlsx缺少必要列: {', '.join(missing_cols)}")
-        sys.exit()
+        sys.exit(EXIT_ERROR)
 
-    # 创建结果DataFrame
-    result_columns = [
-        'zip_file_name', 'shp_file_relative', '地块编码', '地块名称', '经度', '纬度',
-        'cpg', 'polygon', 'field', 'field_content', 'crs', 'In_polygon',
-        '经度new', '纬度new', 'result'
-    ]
-    result_df = pd.DataFrame(columns=result_columns)
-    for col in result_columns:
-        result_df[col] = result_df[col].astype(str)
+    # 按地块编码建立索引，重复的地块编码作为数据质量问题提前报告
+    land_block_index, duplicate_codes = build_land_block_index(original_df)
+    if duplicate_codes:
+        print(f"数据质量问题：地块信息中有 {len(duplicate_codes)} 个地块编码重复（检查时使用第一行）：")
+        for code, count in duplicate_codes.items():
+            print(f"  {code}: 出现 {count} 次")
+    return original_df, land_block_index, duplicate_codes
 
-    # 创建地图
-    m = folium.Map(location=[23.1, 113.25], zoom_start=10, control_scale=True,
-                   tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-                   attr='Esri')
 
-    # 收集所有zip文件
-    zip_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.zip')]
+def zip_task_options(popup_fields=POPUP_FIELDS_ALL, read_engine=None, use_arrow=False, repair_geometry=False,
+                     suggest_point=SUGGEST_POINT_CENTROID, boundary_layer=None, check_overlaps=True,
+                     map_overview=False):
+    """所有检查任务共用的读取和检查选项（map_overview 为True时生成外部图层模式使用的概览几何）"""
+    return {
+        'read_options': {
+            'all_columns': popup_fields == POPUP_FIELDS_ALL,
+            'engine': read_engine,
+            'use_arrow': use_arrow,
+        },
+        'repair_geometry': repair_geometry,
+        'suggest_point': suggest_point,
+        'boundary_layer': boundary_layer,
+        'check_overlaps': check_overlaps,
+        'map_overview': map_overview,
+    }
 
-    # 按地块编码分组ZIP文件
-    zip_by_land_block = defaultdict(list)
-    for zf in zip_files:
-        land_block_code = extract_land_block_code(zf)
-        if land_block_code:
-            zip_by_land_block[land_block_code].append(zf)
 
-    # 处理每个匹配的ZIP文件（每个ZIP独立处理）
-    for land_block_code, zip_list in zip_by_land_block.items():
-        # 检查地块编码是否在原始数据中
-        matching_rows = original_df[original_df['地块编码'] == land_block_code]
-        if matching_rows.empty:
-            # 记录未匹配到地块信息的ZIP
-            for zip_file in zip_list:
-                result_dict = {
-                    'zip_file_name': zip_file,
-                    '地块编码': land_block_code,
-                    'result': '地块信息中未找到该地块编码'
-                }
-                # 使用pd.concat替代append
-                result_df = pd.concat([result_df, pd.DataFrame([result_dict])], ignore_index=True)
-            continue
+def zip_task(folder_path, zip_file, land_block_code, row, zip_list, duplicate_codes, task_options):
+    """生成单个ZIP的检查任务（zip_list 为同一地块编码的所有ZIP，点标记只加在第一个ZIP上）"""
+    return dict(
+        task_options,
+        zip_path=os.path.join(folder_path, zip_file),
+        zip_file=zip_file,
+        land_block_code=land_block_code,
+        row=row,
+        add_marker=zip_file == zip_list[0],  # 点标记只添加一次，避免重复
+        duplicate_count=duplicate_codes.get(land_block_code, 0),
+    )
 
-        # 获取地块信息（取第一行，假设地块编码唯一）
-        row = matching_rows.iloc[0]
 
-        # 处理该地块编码对应的所有ZIP文件
-        for zip_file in zip_list:
-            zip_path = os.path.join(folder_path, zip_file)
-            # print(f"正在处理: {zip_file} (地块编码: {land_block_code})")
-
-            result_dict = {
-                'zip_file_name': zip_file,
-                '地块编码': land_block_code,
-                '地块名称': row.get('地块名称', ''),
-                '经度': row['经度'],
-                '纬度': row['纬度'],
-                'result': []  # 改为列表，用于累积所有问题
-            }
+def land_block_not_found_result(zip_file, land_block_code):
+    """未匹配到地块信息的ZIP的结果记录"""
+    return {
+        'zip_file_name': zip_file,
+        '地块编码': land_block_code,
+        'issues': [(Issue.LAND_BLOCK_NOT_FOUND, None)]
+    }
 
-            # 确保临时目录干净
-            safe_remove_temp_dir()
-            os.makedirs(TEMP_DIR, exist_ok=True)
 
-            try:
-                # 解压zip并查找shp文件
-                try:
-                    shp_path, cpg_exists = extract_shp_from_zip(zip_path)
-                    # 获取SHP文件在ZIP中的相对路径（修复中文乱码）
-                    shp_relative = os.path.relpath(shp_path, TEMP_DIR)
-                    # 尝试修复中文路径乱码
-                    try:
-                        shp_relative = shp_relative.encode('latin1').decode('gbk')
-                    except:
-                        try:
-                            shp_relative = shp_relative.encode('latin1').decode('utf-8')
-                        except:
-                            pass
-                    result_dict['shp_file_relative'] = shp_relative
-                except Exception as e:
-                    result_dict['result'].append(f"解压错误: {str(e)}")
-                    print(f"处理 {zip_file} 时出错:\n{traceback.format_exc()}")
-                    # 使用pd.concat替代append
-                    result_dict['result'] = " | ".join(result_dict['result']) if result_dict['result'] else "pass"
-                    result_df = pd.concat([result_df, pd.DataFrame([result_dict])], ignore_index=True)
-                    continue
+def _new_result_dict(task):
+    """生成检查任务的初始结果记录（地块信息和地块编码重复问题）"""
+    row = task['row']
+    result_dict = {
+        'zip_file_name': task['zip_file'],
+        '地块编码': task['land_block_code'],
+        '地块名称': row.get('地块名称', ''),
+        '经度': row['经度'],
+        '纬度': row['纬度'],
+        'issues': []  # 累积所有问题 (Issue, 详细信息)，汇总时再生成result字段
+    }
+    if task.get('duplicate_count'):
+        result_dict['issues'].append((Issue.DUPLICATE_LAND_BLOCK_CODE, f"共{task['duplicate_count']}行，使用第一行"))
+    return result_dict
 
-                # 检查cpg文件（不区分大小写）
-                if not cpg_exists:
-                    result_dict['cpg'] = '缺失cpg文件'
-                    result_dict['result'].append('cpg文件缺失')
-                else:
-                    result_dict['cpg'] = '是'
 
-                # 读取shp文件（自动检测编码）
-                gdf = None
-                sf = None
-                try:
-                    # 检测编码
-                    encoding = detect_encoding(shp_path)
-                    # print(f"检测到SHP编码: {encoding} (地块编码: {land_block_code})")
+def precheck_result(task):
+    """快速预检查ZIP的结构问题，发现无法继续检查的问题时返回结果记录，否则返回None
 
-                    # 读取shp
-                    # gdf = gpd.read_file(shp_path, encoding=encoding)
-                    try:
-                        # 优先尝试指定编码
-                        gdf = gpd.read_file(shp_path, encoding=encoding)
-                    except:
-                        # 如果失败，尝试使用errors='ignore'忽略编码错误
-                        gdf = gpd.read_file(shp_path, encoding=encoding, errors='ignore')
-
-                    # 显式关闭shapefile.Reader
-                    sf = shapefile.Reader(shp_path, encoding=encoding)
-                    # 立即读取编码并关闭
-                    # encoding = sf.encoding
-                    result_dict['encoding'] = sf.encoding
-                    sf.close()
-                    sf = None
-                except Exception as e:
-                    if sf:
-                        try:
-                            sf.close()
-                        except:
-                            pass
-                    result_dict['result'].append(f"shp读取错误: {str(e)}")
-                    # 使用pd.concat替代append
-                    result_dict['result'] = " | ".join(result_dict['result']) if result_dict['result'] else "pass"
-                    result_df = pd.concat([result_df, pd.DataFrame([result_dict])], ignore_index=True)
-                    continue
-                finally:
-                    # 确保shapefile.Reader已关闭
-                    if sf:
-                        try:
-                            sf.close()
-                        except:
-                            pass
+    无法继续检查的问题：ZIP无法打开、没有.shp文件、缺少.shx/.dbf、.shp文件头无效、点/线/空几何图层。
+    返回的结果记录中同时报告cpg、prj缺失。ZIP中有多个.shp时不预检查，由完整检查逐个图层检查。
+    """
+    result_dict = _new_result_dict(task)
+    try:
+        info = precheck_zip(task['zip_path'])
+    except Exception as e:
+        result_dict['issues'].append((Issue.EXTRACT_ERROR, str(e)))
+        return result_dict
+
+    if info['shp_file_relative'] is None:
+        result_dict['issues'].append((Issue.EXTRACT_ERROR, info['error']))
+        return result_dict
+    if len(info['shp_files']) > 1:
+        return None
+    result_dict['shp_file_relative'] = info['shp_file_relative']
+
+    fatal = []
+    missing = [ext for ext in ('.shx', '.dbf') if ext not in info['extensions']]
+    if missing:
+        fatal.append((Issue.READ_ERROR, f"缺少{'、'.join(missing)}文件"))
+    elif info['error'] is not None:
+        fatal.append((Issue.READ_ERROR, info['error']))
+    elif info['geometry_type'] in ('point', 'line'):
+        result_dict['polygon'] = f"{info['geometry_type']} shp，请转为polygon shp"
+        fatal.append((Issue.GEOMETRY_TYPE, None))
+    elif info['geometry_type'] == 'null':
+        fatal.append((Issue.NO_GEOMETRY, None))
+    if not fatal:
+        return None
+
+    if not info['cpg_exists']:
+        result_dict['cpg'] = '缺失cpg文件'
+        result_dict['issues'].append((Issue.CPG_MISSING, None))
+    else:
+        result_dict['cpg'] = '是'
+    result_dict['issues'].extend(fatal)
+    if '.prj' not in info['extensions']:
+        result_dict['crs'] = '.prj文件不存在'
+        result_dict['issues'].append((Issue.PRJ_MISSING, None))
+    return result_dict
+
+
+def check_zip_file(task):
+    """检查单个ZIP中的所有shp图层（可在子进程中运行），返回 [(结果记录, 地图图层), ...]，每个图层一条
+
+    ZIP中有多个.shp时ZIP只读取一次，各图层在线程池中并行检查，再按 mark_boundary_layer 的规则选出主图层。
+    结果记录包含各阶段耗时列。
+    """
+    zip_data = task.get('zip_data')
+    try:
+        with zipfile.ZipFile(io.BytesIO(zip_data) if zip_data is not None else task['zip_path'], 'r') as zip_ref:
+            shp_files = inspect_zip(zip_ref)['shp_files']
+    except Exception:
+        shp_files = []  # ZIP无法打开或没有.shp时由图层检查报告解压错误
+
+    if len(shp_files) <= 1:
+        results = [check_layer(task)]
+    else:
+        if zip_data is None:
+            zip_data = read_file_bytes(task['zip_path'])
+        layer_tasks = [dict(task, zip_data=zip_data, shp_name=shp_name) for shp_name in shp_files]
+        with ThreadPoolExecutor(max_workers=min(len(layer_tasks), LAYER_THREADS)) as executor:
+            results = list(executor.map(check_layer, layer_tasks))
+    mark_boundary_layer(results, task.get('boundary_layer'))
+    return results
+
+
+def check_zip_file_counted(task):
+    """检查单个ZIP（见 check_zip_file），同时返回本次检查的坐标转换器/坐标系缓存命中次数增量
+
+    缓存在每个检查进程中各自累计，主进程按ZIP汇总增量才能得到多进程运行的缓存统计。
+    """
+    before = cache_counters()
+    results = check_zip_file(task)
+    return results, cache_counters_delta(before, cache_counters())
+
+
+def check_layer(task):
+    """检查ZIP中的一个shp图层（task['shp_name']，未指定时为第一个），返回结果记录和地图图层数据，结果记录包含各阶段耗时列"""
+    timer = StageTimer()
+    result_dict, layer = _check_zip_file(task, timer)
+    result_dict.update(timer.as_columns(ZIP_TIMING_STAGES))
+    return result_dict, layer
+
+
+def mark_boundary_layer(results, pattern=None):
+    """在ZIP的各图层检查结果中选出作为地块边界的主图层，附属图层不做申报坐标相关的检查
+
+    规则：指定 pattern 时取 shp_file_relative 与之匹配（通配符，不区分大小写）的第一个图层；否则取椭球面积最大的
+    面图层（地块边界通常包含子地块等附属图层）；都没有时取第一个图层。附属图层不报告点面包含和建议坐标问题，
+    不参与跨地块重叠检查，也不添加申报坐标点标记。
+    """
+    if len(results) == 1:
+        results[0][0]['layer_role'] = '主边界'
+        return
 
-                # 检查几何类型
-                if gdf.empty or 'geometry' not in gdf.columns:
-                    result_dict['result'].append('SHP文件无有效几何数据')
-                else:
-                    geom_types = gdf.geometry.geom_type.unique()
-                    if 'Polygon' in geom_types or 'MultiPolygon' in geom_types:
-                        result_dict['polygon'] = '是'
-                    elif 'Point' in geom_types:
-                        result_dict['polygon'] = 'point shp，请转为polygon shp'
-                        result_dict['result'].append('几何类型错误')
-                    else:
-                        result_dict['polygon'] = 'line shp，请转为polygon shp'
-                        result_dict['result'].append('几何类型错误')
-
-                # 检查必要字段（支持中英文）
-                required_fields_mapping = {
-                    '地块名称': ['地块名称', 'DKMC', 'dkmc'],
-                    '地块代码': ['地块代码', 'DKDM', 'DKBM', 'dkdm', 'dkbm'],
-                    '行政区代码': ['行政区代码', 'XZQDM', 'xzqdm'],
-                    '行政区名称': ['行政区名称', 'XZQMC', 'xzqmc'],
-                    '地块面积': ['地块面积', 'YDMJ', 'ydmj']
-                }
+    chosen = None
+    if pattern:
+        chosen = next((index for index, (result_dict, _) in enumerate(results)
+                       if result_dict.get('shp_file_relative')
+                       and fnmatch.fnmatch(result_dict['shp_file_relative'].lower(), pattern.lower())), None)
+    if chosen is None:
+        areas = [layer.get('area', -1.0) if layer is not None else -1.0 for _, layer in results]
+        chosen = int(np.argmax(areas))
+
+    for index, (result_dict, layer) in enumerate(results):
+        if index == chosen:
+            result_dict['layer_role'] = f"主边界（共{len(results)}个图层）"
+            continue
+        result_dict['layer_role'] = '附属图层'
+        result_dict['issues'] = [(issue, detail) for issue, detail in result_dict['issues']
+                                 if issue not in BOUNDARY_LAYER_ISSUES]
+        result_dict.pop('suggested_point', None)
+        if 'In_polygon' in result_dict:
+            result_dict['In_polygon'] = '附属图层，不检查'
+        if layer is not None:
+            layer['footprint'] = None
+            layer['marker'] = None
+
+
+def _check_zip_file(task, timer):
+    """执行ZIP中一个shp图层的各项检查，各阶段耗时记入timer"""
+    zip_path = task['zip_path']
+    zip_file = task['zip_file']
+    land_block_code = task['land_block_code']
+    row = task['row']
+    layer = None
+    result_dict = _new_result_dict(task)
 
-                found_fields = []
-                for chinese_field, possible_names in required_fields_mapping.items():
-                    for name in possible_names:
-                        if name in gdf.columns:
-                            found_fields.append(chinese_field)
-                            break
-
-                if len(found_fields) < 5:
-                    missing = [field for field in required_fields_mapping.keys() if field not in found_fields]
-                    result_dict['field'] = f'缺少字段：{", ".join(missing)}'
-                    result_dict['result'].append('字段缺失')
-                else:
-                    result_dict['field'] = '是'
-
-                # 检查字段内容
-                empty_fields = []
-                for chinese_field, possible_names in required_fields_mapping.items():
-                    for name in possible_names:
-                        if name in gdf.columns:
-                            if gdf[name].isnull().all():
-                                empty_fields.append(chinese_field)
-                            break
-
-                if empty_fields:
-                    result_dict['field_content'] = f'字段内容为空：{", ".join(empty_fields)}'
-                    result_dict['result'].append('字段内容为空')
+    try:
+        # 从zip中读取shp文件组到内存（SHP文件在ZIP中的相对路径已修复中文乱码）
+        try:
+            zip_source = io.BytesIO(task['zip_data']) if task.get('zip_data') is not None else zip_path
+            shp_relative, shp_members, cpg_exists, _ = read_shp_from_zip(zip_source, task.get('shp_name'))
+            result_dict['shp_file_relative'] = shp_relative
+        except Exception as e:
+            result_dict['issues'].append((Issue.EXTRACT_ERROR, str(e)))
+            print(f"处理 {zip_file} 时出错:\n{traceback.format_exc()}")
+            return result_dict, layer
+        finally:
+            timer.lap('extract')
+
+        # 检查cpg文件（不区分大小写）
+        if not cpg_exists:
+            result_dict['cpg'] = '缺失cpg文件'
+            result_dict['issues'].append((Issue.CPG_MISSING, None))
+        else:
+            result_dict['cpg'] = '是'
+
+        # 读取shp文件（分级检测编码并记录检测依据，几何和属性只读取一次）
+        read_options = task.get('read_options', {})
+        try:
+            encoding, result_dict['encoding_source'] = detect_dbf_encoding(shp_members)
+            timer.lap('encoding')
+            gdf, result_dict['encoding'] = load_shp_layer(
+                shp_members,
+                encoding,
+                all_columns=read_options.get('all_columns', True),
+                engine=read_options.get('engine'),
+                use_arrow=read_options.get('use_arrow', False),
+            )
+        except Exception as e:
+            result_dict['issues'].append((Issue.READ_ERROR, str(e)))
+            return result_dict, layer
+        finally:
+            timer.lap('read')
+
+        # 检查几何类型
+        if gdf.empty or 'geometry' not in gdf.columns:
+            result_dict['issues'].append((Issue.NO_GEOMETRY, None))
+        else:
+            geom_types = gdf.geometry.geom_type.unique()
+            if 'Polygon' in geom_types or 'MultiPolygon' in geom_types:
+                result_dict['polygon'] = '是'
+            elif 'Point' in geom_types:
+                result_dict['polygon'] = 'point shp，请转为polygon shp'
+                result_dict['issues'].append((Issue.GEOMETRY_TYPE, None))
+            else:
+                result_dict['polygon'] = 'line shp，请转为polygon shp'
+                result_dict['issues'].append((Issue.GEOMETRY_TYPE, None))
+
+        # 检查面图层的几何有效性（自相交、空几何、零面积），可选用make_valid修复后再做后续检查
+        unrepaired_invalid = False
+        if result_dict.get('polygon') == '是':
+            validity = check_geometry_validity(gdf.geometry.values)
+            invalid_count = int(validity['invalid'].sum())
+            empty_count = int((validity['missing'] | validity['empty']).sum())
+            zero_area_count = int(validity['zero_area'].sum())
+            notes = []
+            if invalid_count:
+                reasons = '、'.join(f"{reason} {count}" for reason, count
+                                   in validity['reasons'].most_common(INVALID_REASON_LIMIT))
+                notes.append(f"无效几何{invalid_count}个（{reasons}）")
+                result_dict['issues'].append((Issue.INVALID_GEOMETRY, f"{invalid_count}个要素"))
+            if empty_count or zero_area_count:
+                if empty_count:
+                    notes.append(f"空几何{empty_count}个")
+                if zero_area_count:
+                    notes.append(f"零面积要素{zero_area_count}个")
+                result_dict['issues'].append((Issue.EMPTY_GEOMETRY, f"{empty_count + zero_area_count}个要素"))
+            if invalid_count and task.get('repair_geometry'):
+                gdf[gdf.geometry.name] = gpd.GeoSeries(repair_geometries(gdf.geometry.values, validity['invalid']),
+                                                       index=gdf.index, crs=gdf.crs)
+                notes.append("已用make_valid修复")
+            else:
+                unrepaired_invalid = invalid_count > 0
+            result_dict['validity'] = '；'.join(notes) if notes else '是'
+        timer.lap('validity')
+
+        # 检查必要字段（支持中英文）
+        required_fields_mapping = REQUIRED_FIELDS_MAPPING
+
+        found_fields = []
+        for chinese_field, possible_names in required_fields_mapping.items():
+            for name in possible_names:
+                if name in gdf.columns:
+                    found_fields.append(chinese_field)
+                    break
+
+        if len(found_fields) < 5:
+            missing = [field for field in required_fields_mapping.keys() if field not in found_fields]
+            result_dict['field'] = f'缺少字段：{", ".join(missing)}'
+            result_dict['issues'].append((Issue.FIELD_MISSING, None))
+        else:
+            result_dict['field'] = '是'
+
+        # 检查字段内容
+        empty_fields = []
+        for chinese_field, possible_names in required_fields_mapping.items():
+            for name in possible_names:
+                if name in gdf.columns:
+                    if gdf[name].isnull().all():
+                        empty_fields.append(chinese_field)
+                    break
+
+        if empty_fields:
+            result_dict['field_content'] = f'字段内容为空：{", ".join(empty_fields)}'
+            result_dict['issues'].append((Issue.FIELD_EMPTY, None))
+        else:
+            result_dict['field_content'] = '是'
+
+        # 检查坐标系（按.prj内容缓存解析结果）
+        crs_info = None
+        if '.prj' in shp_members:
+            crs_info = classify_crs(shp_members['.prj'], gdf.crs)
+            result_dict['crs'] = format_crs(crs_info)
+
+            # 地理坐标系警告（但不中断处理）
+            if crs_info.kind == "Geographic":
+                result_dict['issues'].append((Issue.GEOGRAPHIC_CRS, None))
+        else:
+            result_dict['crs'] = '.prj文件不存在'
+            result_dict['issues'].append((Issue.PRJ_MISSING, None))
+
+        timer.lap('checks')
+
+        # 检查点是否在面内（无论坐标系类型）
+        if 'geometry' in gdf.columns and not gdf.empty:
+            point = Point(row['经度'], row['纬度'])
+
+            # 转换点到shp的坐标系
+            try:
+                # 原始坐标系是CGCS2000地理坐标
+                point_projected = transform_point(point, "EPSG:4490", gdf.crs)
+            except Exception as e:
+                result_dict['issues'].append((Issue.CRS_TRANSFORM_ERROR, str(e)))
+                timer.lap('transform')
+            else:
+                timer.lap('transform')
+                # 检查点是否在多边形内：明显在.shp文件头范围外时不再建立空间索引，否则空间索引批量查询
+                try:
+                    _, shp_bbox = read_shp_header(shp_members['.shp'][:SHP_HEADER_SIZE])
+                except (KeyError, ValueError):
+                    shp_bbox = None
+                if shp_bbox is not None and point_outside_extent(shp_bbox, point_projected):
+                    within_polygon = False
                 else:
-                    result_dict['field_content'] = '是'
+                    within_polygon = point_in_layer(gdf, point_projected)
+                timer.lap('contain')
 
-                # 检查坐标系
-                prj_path = os.path.splitext(shp_path)[0] + ".prj"
-
-                if os.path.exists(prj_path):
-                    coord_type, coord_system = is_projection_crs(prj_path)
-                    result_dict['crs'] = coord_system
-
-                    # 地理坐标系警告（但不中断处理）
-                    if coord_type == "Geographic":
-                        result_dict['result'].append('地理坐标系（注意：应使用投影坐标系）')
+                if within_polygon:
+                    result_dict['In_polygon'] = '是'
                 else:
-                    result_dict['crs'] = '.prj文件不存在'
-                    result_dict['result'].append('坐标系文件缺失')
+                    result_dict['In_polygon'] = '地块位置不在边界范围内'
+                    result_dict['issues'].append((Issue.OUTSIDE_BOUNDARY, None))
 
-                # 检查点是否在面内（无论坐标系类型）
-                if 'geometry' in gdf.columns and not gdf.empty:
-                    point = Point(row['经度'], row['纬度'])
-                    point_series = gpd.GeoSeries([point], crs="EPSG:4490")  # 原始坐标系是CGCS2000地理坐标
-
-                    # 转换点到shp的坐标系
+                    # 计算建议坐标：在图层坐标系下向量化计算代表点（不合并要素），
+                    # 转换为经纬度在所有ZIP检查完成后由主进程按坐标系分组批量完成
                     try:
-                        point_projected = point_series.to_crs(gdf.crs).iloc[0]
+                        geometries = gdf.geometry.values
+                        x, y = layer_representative_point(
+                            shapely.make_valid(geometries) if unrepaired_invalid else geometries,
+                            task.get('suggest_point', SUGGEST_POINT_CENTROID))
+                        result_dict['suggested_point'] = [x, y, gdf.crs.to_wkt()]
                     except Exception as e:
-                        result_dict['result'].append(f'坐标系转换失败: {str(e)}')
-                    else:
-                        # 检查点是否在多边形内
-                        within_polygon = False
-                        for poly in gdf.geometry:
-                            if point_projected.within(poly):
-                                within_polygon = True
-                                break
-
-                        if within_polygon:
-                            result_dict['In_polygon'] = '是'
-                        else:
-                            result_dict['In_polygon'] = '地块位置不在边界范围内'
-                            result_dict['result'].append('地块位置不在边界范围内')
-
-                            # 计算多边形中心
-                            centroid = gdf.geometry.unary_union.centroid
-                            try:
-                                # 1. 首先检查.prj文件标识的坐标系类型
-                                prj_path = os.path.splitext(shp_path)[0] + ".prj"
-                                coord_type = "Unknown"
-                                # coord_system = "Unknown"
-                                if os.path.exists(prj_path):
-                                    coord_type, _ = is_projection_crs(prj_path)
-
-                                # 2. 检查实际坐标值范围来确认坐标系类型
-                                # 如果坐标值在合理经纬度范围内，则认为是地理坐标
-                                if -180 <= centroid.x <= 180 and -90 <= centroid.y <= 90:
-                                    # is_geo = True
-                                    coord_type = "Geographic"
-                                    print(
-                                        f"地块 {land_block_code}: 检测到实际为地理坐标系 (x={centroid.x:.6f}, y={centroid.y:.6f})")
-                                else:
-                                    # 如果坐标值超出经纬度范围，但.prj标识为地理坐标，则可能是错误
-                                    if coord_type == "Geographic" and (abs(centroid.x) > 180 or abs(centroid.y) > 90):
-                                        print(
-                                            f"警告: 地块 {land_block_code} 的.prj标识为地理坐标系，但坐标值超出范围 (x={centroid.x:.6f}, y={centroid.y:.6f})")
-                                        # 尝试将其视为投影坐标处理
-                                        coord_type = "Projection"
-                                    # is_geo = False
-
-                                # 3. 根据实际坐标系类型处理
-                                if coord_type == "Geographic":
-                                    # 地理坐标系下，确保输出的是经纬度
-                                    if -180 <= centroid.x <= 180 and -90 <= centroid.y <= 90:
-                                        result_dict['经度new'] = round(centroid.x, 6)
-                                        result_dict['纬度new'] = round(centroid.y, 6)
-                                        print(
-                                            f"地块 {land_block_code}: 使用地理坐标系值 (经度: {result_dict['经度new']}, 纬度: {result_dict['纬度new']})")
-                                    else:
-                                        # 虽然标识为地理坐标，但值超出范围，尝试转换
-                                        print(f"地块 {land_block_code}: 地理坐标值异常，尝试转换")
-                                        centroid_series = gpd.GeoSeries([centroid], crs=gdf.crs)
-                                        centroid_cgcs = centroid_series.to_crs("EPSG:4490").iloc[0]
-                                        result_dict['经度new'] = round(centroid_cgcs.x, 6)
-                                        result_dict['纬度new'] = round(centroid_cgcs.y, 6)
-                                        print(
-                                            f"地块 {land_block_code}: 转换后坐标 (经度: {result_dict['经度new']}, 纬度: {result_dict['纬度new']})")
-                                else:
-                                    # 投影坐标系下，需要转换回地理坐标
-                                    centroid_series = gpd.GeoSeries([centroid], crs=gdf.crs)
-                                    centroid_cgcs = centroid_series.to_crs("EPSG:4490").iloc[0]
-                                    result_dict['经度new'] = round(centroid_cgcs.x, 6)
-                                    result_dict['纬度new'] = round(centroid_cgcs.y, 6)
-                                    print(
-                                        f"地块 {land_block_code}: 投影坐标转换 (经度: {result_dict['经度new']}, 纬度: {result_dict['纬度new']})")
-
-                                # 4. 验证新坐标是否在合理范围内
-                                if not (-180 <= result_dict['经度new'] <= 180) or not (
-                                        -90 <= result_dict['纬度new'] <= 90):
-                                    print(
-                                        f"警告: 地块 {land_block_code} 的新坐标超出合理范围 (经度: {result_dict['经度new']}, 纬度: {result_dict['纬度new']})")
-                                    result_dict['result'].append('新坐标计算异常')
-
-                            except Exception as e:
-                                result_dict['result'].append(f'中心点坐标计算失败')
-                                print(f"计算地块 {land_block_code} 的中心点坐标时出错: {str(e)}")
-                else:
-                    result_dict['result'].append('无法检查点是否在多边形内（无有效几何数据）')
-
-                # === 关键修复：转换Timestamp对象为字符串 ===
-                gdf = convert_timestamps_to_strings(gdf)
-
-                # 添加到地图（为每个ZIP创建独立图层）
-                layer_name = f"{zip_file} ({land_block_code})"
-                popup_content = folium.Popup(
-                    f"<b>ZIP文件:</b> {zip_file}<br>"
-                    f"<b>地块编码:</b> {land_block_code}<br>"
-                    + pd.DataFrame(gdf.drop(columns='geometry', errors='ignore')).to_html(),
-                    max_width=1200
-                )
-                folium.GeoJson(
-                    gdf,
-                    style_function=style_function,
-                    tooltip=layer_name,
-                    popup=popup_content,
-                    name=layer_name
-                ).add_to(m)
-
-                # 添加点标记（只添加一次，避免重复）
-                if zip_file == zip_list[0]:  # 只在第一个ZIP时添加
-                    folium.Marker(
-                        [row['纬度'], row['经度']],
-                        popup=f"{land_block_code}<br>{row.get('地块名称', '')}",
-                        icon=folium.Icon(color='lightblue', icon='info-sign'),
-                        tooltip=land_block_code
-                    ).add_to(m)
+                        result_dict['issues'].append((Issue.CENTROID_ERROR, None))
+                        print(f"计算地块 {land_block_code} 的中心点坐标时出错: {str(e)}")
+                    timer.lap('centroid')
+        else:
+            result_dict['issues'].append((Issue.CONTAINMENT_UNCHECKED, None))
+
+        # === 关键修复：转换Timestamp对象为字符串 ===
+        gdf = convert_timestamps_to_strings(gdf)
+
+        # 准备地图图层数据（由主进程统一添加到地图，保证图层顺序确定）
+        layer_name = f"{zip_file} ({land_block_code})"
+        if task.get('shp_name'):
+            layer_name += f" {result_dict['shp_file_relative']}"
+        if gdf.crs is None:
+            # 缺少.prj时无法投影：坐标落在经纬度范围内才按原坐标绘制，
+            # 地块范围和面积都依赖真实坐标系，不参与重叠检查和主图层选择
+            min_x, min_y, max_x, max_y = gdf.total_bounds
+            if not (-180 <= min_x <= max_x <= 180 and -90 <= min_y <= max_y <= 90):
+                timer.lap('map_layer')
+                return result_dict, None
+            gdf_wgs84 = gdf
+        else:
+            gdf_wgs84 = gdf.to_crs("EPSG:4326")
+        layer = {
+            'name': layer_name,
+            'geojson': gdf_wgs84.to_json(),
+            # 外部图层模式使用的概览几何：按概览缩放级别的像素大小简化，不含属性；内嵌地图不使用，不计算
+            'overview_geojson': gdf_wgs84.geometry.simplify(
+                map_simplify_tolerance(MAP_OVERVIEW_ZOOM), preserve_topology=True).to_json()
+            if task.get('map_overview') else None,
+            'popup': f"<b>ZIP文件:</b> {zip_file}<br>"
+                     f"<b>地块编码:</b> {land_block_code}<br>"
+                     + pd.DataFrame(gdf.drop(columns='geometry', errors='ignore')).to_html(),
+            'marker': {
+                'location': [row['纬度'], row['经度']],
+                'popup': f"{land_block_code}<br>{row.get('地块名称', '')}",
+                'tooltip': land_block_code,
+            } if task['add_marker'] else None,
+            # 跨地块重叠检查使用的地块范围（面图层所有要素合并后的WGS84几何，WKB十六进制），不检查重叠时不计算
+            'footprint': shapely.to_wkb(shapely.union_all(
+                shapely.make_valid(gdf_wgs84.geometry.values) if unrepaired_invalid else gdf_wgs84.geometry.values),
+                hex=True) if (result_dict.get('polygon') == '是' and task.get('check_overlaps', True)
+                              and gdf.crs is not None) else None,
+        }
+        if task.get('shp_name') and result_dict.get('polygon') == '是' and gdf.crs is not None:
+            # 多图层ZIP：各要素椭球面积之和，用于选出主边界图层（见 mark_boundary_layer）
+            layer['area'] = sum(geodesic_area(geometry) for geometry in gdf_wgs84.geometry.values
+                                if geometry is not None and not geometry.is_empty)
+        timer.lap('map_layer')
 
-            except Exception as e:
-                result_dict['result'].append(f"处理错误: {str(e)}")
-                print(f"处理 {zip_file} 时出错:\n{traceback.format_exc()}")
+    except Exception as e:
+        result_dict['issues'].append((Issue.PROCESS_ERROR, str(e)))
+        print(f"处理 {zip_file} 时出错:\n{traceback.format_exc()}")
+
+    return result_dict, layer
+
+
+GEOD = Geod(ellps='GRS80')  # CGCS2000与GRS80椭球参数几乎相同，用于计算WGS84/CGCS2000经纬度几何的椭球面积
+
+
+def geodesic_area(geometry):
+    """计算经纬度几何的椭球面积（平方米），不受投影分带影响"""
+    return abs(GEOD.geometry_area_perimeter(geometry)[0])
+
+
+def geometry_hash(geometry):
+    """按约1厘米精度规范化几何后计算哈希，用于查找完全相同的边界"""
+    normalized = shapely.normalize(shapely.set_precision(geometry, OVERLAP_HASH_GRID))
+    return hashlib.sha1(shapely.to_wkb(normalized)).hexdigest()
+
+
+class FootprintStore:
+    """跨地块重叠检查的地块范围累加器
+
+    spool 为False时在内存中保留各地块的WGS84几何；为True时（流式模式）几何以WKB写入磁盘临时文件，内存中只保留
+    外包矩形、ZIP文件名、地块编码和结果序号，find_parcel_overlaps 按外包矩形建立空间索引，只读回候选地块对的几何。
+    """
+
+    def __init__(self, spool=False):
+        self.indexes = []  # 各地块在结果累加器中的序号
+        self.zip_files = []
+        self.land_block_codes = []
+        self.bounds = array('d')  # 每个地块4个值：xmin, ymin, xmax, ymax
+        self.geometries = None if spool else []
+        self.spool_file = tempfile.TemporaryFile() if spool else None
+        self.offsets = array('q')  # 流式模式下每个地块2个值：WKB在临时文件中的偏移和长度
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def append(self, index, zip_file, land_block_code, footprint):
+        """添加一个地块范围（footprint 为 _check_zip_file 生成的WKB十六进制，或已解析的几何）"""
+        geometry = shapely.from_wkb(footprint) if isinstance(footprint, str) else footprint
+        self.indexes.append(index)
+        self.zip_files.append(zip_file)
+        self.land_block_codes.append(land_block_code)
+        self.bounds.extend(shapely.bounds(geometry))
+        if self.spool_file is None:
+            self.geometries.append(geometry)
+            return
+        data = bytes.fromhex(footprint) if isinstance(footprint, str) else shapely.to_wkb(geometry)
+        self.spool_file.seek(0, os.SEEK_END)
+        self.offsets.extend((self.spool_file.tell(), len(data)))
+        self.spool_file.write(data)
+
+    def index_geometries(self):
+        """返回建立空间索引用的几何数组：内存模式为地块几何本身，流式模式为外包矩形"""
+        if self.spool_file is None:
+            return np.array(self.geometries)
+        bounds = np.frombuffer(self.bounds, dtype=float).reshape(-1, 4)
+        return shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+
+    def geometry(self, position):
+        """返回第 position 个地块的几何（流式模式从临时文件读回）"""
+        if self.spool_file is None:
+            return self.geometries[position]
+        offset, length = self.offsets[2 * position], self.offsets[2 * position + 1]
+        self.spool_file.seek(offset)
+        return shapely.from_wkb(self.spool_file.read(length))
+
+    def close(self):
+        if self.spool_file is not None:
+            self.spool_file.close()
+
+
+def find_parcel_overlaps(footprints, min_area=OVERLAP_MIN_AREA, only=None):
+    """用一棵STRtree查找不同地块编码的地块之间的边界重叠和完全相同的边界
+
+    footprints 为 FootprintStore，返回重叠记录列表 [{'a'/'b': 结果序号, 'zip_a'/'zip_b': ZIP文件名,
+    'code_a'/'code_b': 地块编码, 'kind': 重叠/完全相同, 'area': 重叠面积, 'ratio': 占较小地块面积比例}]。
+    同一地块编码的多个ZIP（如初步调查和详细调查）边界本应一致，不参与比较。
+    only 为地块位置的集合时只查找至少一方在其中的地块对（监视模式只重新检查变化的地块）。
+    """
+    if len(footprints) < 2 or (only is not None and not only):
+        return []
+    index_geometries = footprints.index_geometries()
+    codes = np.array(footprints.land_block_codes)
+    tree = shapely.STRtree(index_geometries)
+    if only is None:
+        left, right = tree.query(index_geometries, predicate='intersects')
+    else:
+        positions = np.array(sorted(only), dtype=np.intp)
+        left, right = tree.query(index_geometries[positions], predicate='intersects')
+        left = positions[left]
+        # 两个地块都在 only 中的地块对会查到两次，只保留一次；统一为左侧序号较小
+        once = ~np.isin(right, positions) | (left < right)
+        left, right = np.minimum(left[once], right[once]), np.maximum(left[once], right[once])
+    del index_geometries
+    keep = (left < right) & (codes[left] != codes[right])
+    # 按 (左侧序号, 右侧序号) 排列，结果顺序与空间索引的内部顺序无关
+    order = np.lexsort((right[keep], left[keep]))
+    left, right = left[keep][order], right[keep][order]
+
+    hashes = {}
+    areas = {}
+
+    def cached(store, func, i, geometry):
+        if i not in store:
+            store[i] = func(geometry)
+        return store[i]
+
+    overlaps = []
+    last_i, geometry_i = None, None
+    for i, j in zip(left.tolist(), right.tolist()):
+        if i != last_i:
+            # 候选地块对按左侧序号排列，左侧地块的几何只读取一次
+            last_i, geometry_i = i, footprints.geometry(i)
+        geometry_j = footprints.geometry(j)
+        if cached(hashes, geometry_hash, i, geometry_i) == cached(hashes, geometry_hash, j, geometry_j):
+            kind, area = '完全相同', cached(areas, geodesic_area, i, geometry_i)
+        else:
+            try:
+                intersection = shapely.intersection(geometry_i, geometry_j)
+            except shapely.errors.GEOSException:
+                intersection = shapely.intersection(shapely.make_valid(geometry_i), shapely.make_valid(geometry_j))
+            if intersection.is_empty or intersection.area == 0:
+                continue  # 只有公共边或公共点的相邻地块（流式模式下还包括外包矩形相交但边界不相交的地块）
+            area = geodesic_area(intersection)
+            if area < min_area:
+                continue
+            kind = '重叠'
+        smaller = min(cached(areas, geodesic_area, i, geometry_i), cached(areas, geodesic_area, j, geometry_j))
+        overlaps.append({'a': footprints.indexes[i], 'b': footprints.indexes[j],
+                         'zip_a': footprints.zip_files[i], 'zip_b': footprints.zip_files[j],
+                         'code_a': footprints.land_block_codes[i], 'code_b': footprints.land_block_codes[j],
+                         'kind': kind, 'area': area, 'ratio': area / smaller if smaller else None})
+    return overlaps
+
+
+def overlap_annotations(overlaps):
+    """由重叠记录生成各地块要追加的问题和overlap列文字，返回 {结果序号: (问题列表, 文字)}（只含有重叠的地块）"""
+    overlap_texts = defaultdict(list)
+    overlap_issues = defaultdict(list)
+    for overlap in overlaps:
+        for index, other in ((overlap['a'], overlap['zip_b']), (overlap['b'], overlap['zip_a'])):
+            if overlap['kind'] == '完全相同':
+                text = f"与{other}边界完全相同"
+                overlap_issues[index].append((Issue.DUPLICATE_GEOMETRY, other))
+            else:
+                text = f"与{other}重叠{overlap['area']:.1f}平方米"
+                overlap_issues[index].append((Issue.PARCEL_OVERLAP, f"{other} {overlap['area']:.1f}平方米"))
+            overlap_texts[index].append(text)
+    return {index: (overlap_issues[index], '；'.join(texts)) for index, texts in overlap_texts.items()}
+
+
+def overlap_dataframe(overlaps):
+    """生成“边界重叠”工作表"""
+    return pd.DataFrame([
+        (overlap['zip_a'], overlap['code_a'], overlap['zip_b'], overlap['code_b'],
+         overlap['kind'], round(overlap['area'], 2),
+         round(overlap['ratio'], 4) if overlap['ratio'] is not None else None)
+        for overlap in overlaps
+    ], columns=OVERLAP_COLUMNS)
+
+
+def read_file_bytes(path):
+    """读取整个文件内容"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def prefetch_ordered(func, items, depth):
+    """用后台线程提前对后续的 depth 个元素执行 func（如读取网络共享上的文件），按原顺序生成 (元素, 结果)"""
+    pending = deque()  # (元素, future)
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        for item in items:
+            if len(pending) >= depth:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+            pending.append((item, executor.submit(func, item)))
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+
+
+def read_zip_data(task):
+    """预读线程：读取ZIP文件内容，增量检查时由读入的内容补算检查前未计算的内容哈希
+
+    读取失败（ZIP已被删除、改名或为失效链接）时返回None，由检查报告解压错误，不中断整批检查。
+    """
+    try:
+        zip_data = read_file_bytes(task['zip_path'])
+    except OSError:
+        return None
+    if 'fingerprint' in task:
+        complete_fingerprint(task, zip_data)
+    return zip_data
 
-            finally:
-                # 确保临时目录被清理
-                safe_remove_temp_dir()
 
-            # 将所有问题汇总到result字段
-            result_dict['result'] = " | ".join(result_dict['result']) if result_dict['result'] else "pass"
-            result_df = pd.concat([result_df, pd.DataFrame([result_dict])], ignore_index=True)
+def _zip_size(task):
+    """ZIP文件大小（用于预读内存计数），无法读取时按0计"""
+    try:
+        return os.path.getsize(task['zip_path'])
+    except OSError:
+        return 0
 
-    # 确保最终清理临时目录
-    safe_remove_temp_dir()
 
-    # 添加图层控制（如果地图上有多个图层）
-    folium.LayerControl().add_to(m)
+def _run_inline(task):
+    """单进程模式的“提交”：在主进程中立即检查，返回已完成的future"""
+    future = Future()
+    try:
+        future.set_result(check_zip_file_counted(task))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def run_prefetched_checks(tasks, submit, depth, max_pending, memory_mb=PREFETCH_MEMORY_MB):
+    """预读模式：后台线程按顺序提前读取ZIP内容，读完后附带ZIP内容（zip_data）提交检查，按任务顺序返回检查结果
+
+    ZIP从开始读取到检查结果被取走都计入内存上限 memory_mb（读取中、等待提交和检查中的ZIP内容都算在内，
+    单个ZIP超过上限时仍会读取）；同时读取的ZIP最多 depth 个，已提交的检查最多 max_pending 个。
+    submit(任务) 返回检查的future。
+    """
+    max_bytes = memory_mb * 1024 * 1024
+    reading = deque()  # (任务, 大小, 读取future)
+    checking = deque()  # (大小, 检查future)
+    used_bytes = 0
+
+    with ThreadPoolExecutor(max_workers=depth) as reader:
+        def advance():
+            """提交最早读完的ZIP；已提交的检查达到上限（或没有读取中的ZIP）时取走最早的检查结果"""
+            nonlocal used_bytes
+            if reading and len(checking) < max_pending:
+                task, size, future = reading.popleft()
+                checking.append((size, submit(dict(task, zip_data=future.result()))))
+                return False, None
+            size, future = checking.popleft()
+            used_bytes -= size
+            return True, future.result()
+
+        for task in tasks:
+            size = _zip_size(task)
+            while (reading or checking) and (len(reading) >= depth or used_bytes + size > max_bytes):
+                done, result = advance()
+                if done:
+                    yield result
+            reading.append((task, size, reader.submit(read_zip_data, task)))
+            used_bytes += size
+            # 已读完的ZIP尽快提交，使检查与后续读取重叠
+            while reading and reading[0][2].done() and len(checking) < max_pending:
+                advance()
+        while reading or checking:
+            done, result = advance()
+            if done:
+                yield result
+
+
+def run_zip_checks(tasks, max_workers=None, max_pending=None, prefetch_depth=0, prefetch_memory_mb=PREFETCH_MEMORY_MB,
+                   executor=None, cache_stats=None):
+    """按任务顺序返回每个ZIP的检查结果，max_workers大于1时使用多进程并行检查
+
+    max_pending 不为None时最多提前提交这么多个任务，已完成但尚未按顺序取走的结果不会无限堆积在内存中。
+    prefetch_depth 大于0时由主进程的后台线程提前读取后续ZIP的内容（最多 prefetch_depth 个、prefetch_memory_mb MB），
+    检查时不再从磁盘或网络共享读取。executor 为常驻的进程池（监视模式）时直接使用，不再创建和关闭进程池。
+    cache_stats 为字典时，各检查进程的坐标转换器/坐标系缓存命中次数累加到其中（见 add_cache_counters）。
+    """
+    for results, delta in _run_zip_checks(tasks, max_workers, max_pending, prefetch_depth, prefetch_memory_mb,
+                                          executor):
+        if cache_stats is not None:
+            add_cache_counters(cache_stats, delta)
+        yield results
+
+
+def _run_zip_checks(tasks, max_workers, max_pending, prefetch_depth, prefetch_memory_mb, executor):
+    """run_zip_checks 的实现，按任务顺序返回 (检查结果, 缓存统计增量)"""
+    if max_workers is None:
+        max_workers = DEFAULT_MAX_WORKERS
+    max_workers = min(max_workers, len(tasks))
+    prefetch = prefetch_depth > 0 and tasks
+
+    if max_workers <= 1 and executor is None:
+        if prefetch:
+            # 单进程预读模式：后台线程读取后续ZIP，主进程逐个检查
+            yield from run_prefetched_checks(tasks, _run_inline, prefetch_depth, 1, prefetch_memory_mb)
+            return
+        # 单进程模式：逐个检查
+        for task in tasks:
+            yield check_zip_file_counted(task)
+        return
 
-    # 保存结果到Excel的新sheet
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        if prefetch:
+            # 预读的任务逐个提交，避免一次性读入所有ZIP
+            yield from run_prefetched_checks(tasks, lambda task: executor.submit(check_zip_file_counted, task),
+                                             prefetch_depth, max_pending or max_workers * 4, prefetch_memory_mb)
+        elif max_pending is not None:
+            # 有界提交：按提交顺序取结果，取走一个再提交下一个
+            pending = deque()
+            for task in tasks:
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(check_zip_file_counted, task))
+            while pending:
+                yield pending.popleft().result()
+        else:
+            # 多进程模式：executor.map 按提交顺序返回结果，保证输出顺序确定
+            chunksize = max(1, len(tasks) // (max(max_workers, 1) * 4))
+            for result in executor.map(check_zip_file_counted, tasks, chunksize=chunksize):
+                yield result
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def open_result_cache(cache_path):
+    """打开（或创建）增量检查缓存数据库，检查规则版本不一致时清空旧缓存"""
+    conn = sqlite3.connect(cache_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "zip_file_name TEXT PRIMARY KEY, zip_size INTEGER, zip_mtime REAL, zip_hash TEXT, "
+        "row_key TEXT, result_json TEXT, layer_json TEXT)"
+    )
+    version = conn.execute("SELECT value FROM meta WHERE key = 'rules_version'").fetchone()
+    if version is None or version[0] != CHECK_RULES_VERSION:
+        conn.execute("DELETE FROM results")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rules_version', ?)",
+                     (CHECK_RULES_VERSION,))
+        conn.commit()
+    return conn
+
+
+_fingerprint_memo = {}  # ZIP路径 -> (大小, 修改时间, 内容哈希)，常驻进程（监视模式）中未变化的ZIP不再重复计算哈希
+
+
+def cached_zip_stat(conn, zip_file):
+    """返回缓存中该ZIP记录的 (大小, 修改时间)，没有缓存记录时返回None"""
+    return conn.execute("SELECT zip_size, zip_mtime FROM results WHERE zip_file_name = ?", (zip_file,)).fetchone()
+
+
+def zip_fingerprint(zip_path, cached_stat):
+    """计算ZIP文件的 (大小, 修改时间, 内容哈希)
+
+    cached_stat 为缓存中该ZIP的 (大小, 修改时间)（见 cached_zip_stat）。没有缓存记录或大小、修改时间已变化时
+    ZIP一定需要重新检查，此时不读取文件，内容哈希为None，检查时再由预读的内容或检查后补算（见 complete_fingerprint）。
+    大小和修改时间都未变化时读取整个文件计算哈希（本进程内已计算过的直接复用）。
+    """
+    stat = os.stat(zip_path)
+    if cached_stat is None or tuple(cached_stat) != (stat.st_size, stat.st_mtime):
+        return stat.st_size, stat.st_mtime, None
+    memo = _fingerprint_memo.get(zip_path)
+    if memo is not None and memo[:2] == (stat.st_size, stat.st_mtime):
+        return memo
+    digest = hashlib.sha256()
+    with open(zip_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    _fingerprint_memo[zip_path] = (stat.st_size, stat.st_mtime, digest.hexdigest())
+    return _fingerprint_memo[zip_path]
+
+
+def try_zip_fingerprint(zip_path, cached_stat):
+    """计算ZIP文件指纹，文件已不存在或无法读取时返回None（不中断整批检查）"""
     try:
-        # 如果Excel文件已有"result"工作表，先删除它
+        return zip_fingerprint(zip_path, cached_stat)
+    except OSError:
+        return None
+
+
+def complete_fingerprint(task, zip_data=None):
+    """补算检查前未计算的ZIP内容哈希（zip_data 为预读的ZIP内容时直接计算，不再读取文件）"""
+    zip_size, zip_mtime, zip_hash = task['fingerprint']
+    if zip_hash is not None:
+        return
+    if zip_data is None:
+        zip_data = read_file_bytes(task['zip_path'])
+    task['fingerprint'] = (zip_size, zip_mtime, hashlib.sha256(zip_data).hexdigest())
+    _fingerprint_memo[task['zip_path']] = task['fingerprint']
+
+
+def prefetch_fingerprints(conn, folder_path, zip_files, depth):
+    """用后台线程并行计算多个ZIP的文件指纹，返回 {ZIP路径: 指纹}（无法读取的ZIP为None）"""
+    items = [(os.path.join(folder_path, zip_file), cached_zip_stat(conn, zip_file)) for zip_file in zip_files]
+    return {item[0]: fingerprint for item, fingerprint in
+            prefetch_ordered(lambda item: try_zip_fingerprint(*item), items, depth)}
+
+
+def _task_row_key(task):
+    """由地块信息行内容和读取选项生成缓存键（地块信息或选项修改后缓存失效）"""
+    return json.dumps([task['land_block_code'], task['row'], task['add_marker'], task.get('read_options'),
+                       task.get('duplicate_count'), task.get('repair_geometry', False),
+                       task.get('suggest_point', SUGGEST_POINT_CENTROID), task.get('boundary_layer'),
+                       task.get('check_overlaps', True), task.get('map_overview', False)],
+                      ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _to_json_value(value):
+    """将numpy标量等转换为可JSON序列化的值"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def lookup_cached_result(conn, task):
+    """查找与ZIP文件指纹和地块信息均一致的缓存结果，返回 [(结果记录, 地图图层), ...]（每个图层一条）或 None"""
+    zip_size, zip_mtime, zip_hash = task['fingerprint']
+    row = conn.execute(
+        "SELECT result_json, layer_json FROM results "
+        "WHERE zip_file_name = ? AND zip_size = ? AND zip_mtime = ? AND zip_hash = ? AND row_key = ?",
+        (task['zip_file'], zip_size, zip_mtime, zip_hash, _task_row_key(task))
+    ).fetchone()
+    if row is None:
+        return None
+    result_json, layer_json = row
+    results = []
+    for result_dict, layer in zip(json.loads(result_json), json.loads(layer_json)):
+        result_dict['issues'] = [(Issue[name], detail) for name, detail in result_dict['issues']]
+        results.append((result_dict, layer))
+    return results
+
+
+def has_cached_result(conn, task):
+    """判断是否有与ZIP文件指纹和地块信息均一致的缓存结果（不读取结果内容）"""
+    zip_size, zip_mtime, zip_hash = task['fingerprint']
+    return conn.execute(
+        "SELECT 1 FROM results "
+        "WHERE zip_file_name = ? AND zip_size = ? AND zip_mtime = ? AND zip_hash = ? AND row_key = ?",
+        (task['zip_file'], zip_size, zip_mtime, zip_hash, _task_row_key(task))
+    ).fetchone() is not None
+
+
+def store_cached_result(conn, task, results):
+    """保存单个ZIP各图层的检查结果和地图图层到缓存"""
+    zip_size, zip_mtime, zip_hash = task['fingerprint']
+    # 问题类型按名称保存，读取缓存时再还原为Issue；耗时只对本次检查有意义，不保存
+    result_dicts = []
+    for result_dict, _ in results:
+        result_dict = {key: value for key, value in result_dict.items() if not key.startswith('time_')}
+        result_dict['issues'] = [(issue.name, detail) for issue, detail in result_dict['issues']]
+        result_dicts.append(result_dict)
+    conn.execute(
+        "INSERT OR REPLACE INTO results "
+        "(zip_file_name, zip_size, zip_mtime, zip_hash, row_key, result_json, layer_json) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (task['zip_file'], zip_size, zip_mtime, zip_hash, _task_row_key(task),
+         json.dumps(result_dicts, ensure_ascii=False, default=_to_json_value),
+         json.dumps([layer for _, layer in results], ensure_ascii=False, default=_to_json_value))
+    )
+
+
+def create_result_map():
+    """创建以卫星影像为底图的结果地图"""
+    return folium.Map(location=[23.1, 113.25], zoom_start=10, control_scale=True,
+                      tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+                      attr='Esri')
+
+
+def add_layer_to_map(m, layer):
+    """将子进程返回的图层数据添加到地图，返回添加的地图元素（监视模式中用于替换或删除）"""
+    elements = [folium.GeoJson(
+        json.loads(layer['geojson']),
+        style_function=style_function,
+        tooltip=layer['name'],
+        popup=folium.Popup(layer['popup'], max_width=1200),
+        name=layer['name']
+    ).add_to(m)]
+
+    # 添加点标记（每个地块编码只添加一次）
+    marker = layer.get('marker')
+    if marker:
+        elements.append(folium.Marker(
+            marker['location'],
+            popup=marker['popup'],
+            icon=folium.Icon(color='lightblue', icon='info-sign'),
+            tooltip=marker['tooltip']
+        ).add_to(m))
+    return elements
+
+
+def map_simplify_tolerance(zoom, pixels=1):
+    """返回在指定缩放级别下相当于若干像素的简化容差（单位：度）"""
+    return 360.0 / (256 * 2 ** zoom) * pixels
+
+
+class ExternalBoundaryLayers(MacroElement):
+    """加载外部图层文件的地图脚本：概览边界随页面加载，完整边界和属性弹窗按需加载"""
+    _template = Template("""
+        {% macro header(this, kwargs) %}
+            <script src="{{ this.files_url }}/layers.js"></script>
+        {% endmacro %}
+
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var filesUrl = {{ this.files_url|tojson }};
+            var style = {color: 'blue', fillColor: 'transparent', weight: 4};
+            var boundaries = L.featureGroup().addTo(map);
+            var markers = L.featureGroup().addTo(map);
+            var entries = {};
+            var popupPositions = {};
+
+            function loadScript(src) {
+                var script = document.createElement('script');
+                script.src = src;
+                document.body.appendChild(script);
+            }
+
+            // 图层文件通过 <script> 加载（本地打开HTML时浏览器禁止 fetch 本地文件）
+            window.boundaryDetailLoaded = function (id, geojson) {
+                entries[id].layer.clearLayers();
+                entries[id].layer.addData(geojson);
+            };
+            window.boundaryPopupLoaded = function (id, html) {
+                L.popup({maxWidth: 1200}).setLatLng(popupPositions[id]).setContent(html).openOn(map);
+            };
+
+            (window.BOUNDARY_LAYERS || []).forEach(function (item) {
+                var layer = L.geoJSON(item.geojson, {style: style}).bindTooltip(item.name);
+                layer.on('click', function (e) {
+                    popupPositions[item.id] = e.latlng;
+                    loadScript(filesUrl + '/popup/' + item.id + '.js');
+                });
+                layer.addTo(boundaries);
+                entries[item.id] = {layer: layer, bounds: layer.getBounds(), detail: false};
+
+                if (item.marker) {
+                    var options = {};
+                    if (L.AwesomeMarkers) {
+                        options.icon = L.AwesomeMarkers.icon(
+                            {icon: 'info-sign', markerColor: 'lightblue', prefix: 'glyphicon'});
+                    }
+                    L.marker(item.marker.location, options)
+                        .bindPopup(item.marker.popup)
+                        .bindTooltip(item.marker.tooltip)
+                        .addTo(markers);
+                }
+            });
+
+            // 放大到详细级别后，只加载视野内地块的完整边界
+            function loadDetails() {
+                if (map.getZoom() < {{ this.detail_zoom }}) {
+                    return;
+                }
+                var view = map.getBounds();
+                Object.keys(entries).forEach(function (id) {
+                    var entry = entries[id];
+                    if (!entry.detail && entry.bounds.isValid() && view.intersects(entry.bounds)) {
+                        entry.detail = true;
+                        loadScript(filesUrl + '/detail/' + id + '.js');
+                    }
+                });
+            }
+            map.on('moveend', loadDetails);
+            loadDetails();
+
+            L.control.layers(null, {'地块边界': boundaries, '地块位置': markers}).addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, files_url, detail_zoom=MAP_DETAIL_ZOOM):
+        super().__init__()
+        self._name = 'ExternalBoundaryLayers'
+        self.files_url = files_url
+        self.detail_zoom = detail_zoom
+
+
+class ExternalMapWriter:
+    """外部图层地图输出：逐个写入图层文件，HTML中只引用文件，地图大小与地块数量无关
+
+    在HTML旁的 <地图名>_files 目录中写入：
+    layers.js（所有地块的简化边界和点标记）、detail/<序号>.js（完整边界）、popup/<序号>.js（属性弹窗）。
+    keep_index 为True时（监视模式）layers.js 的各行保留在内存中，可删除图层，每轮检查后用 write_index() 重新写出。
+    """
+
+    def __init__(self, map_path, keep_index=False):
+        self.files_dir = os.path.splitext(map_path)[0] + "_files"
+        self.files_url = urllib.parse.quote(os.path.basename(self.files_dir))
+        if os.path.isdir(self.files_dir):
+            shutil.rmtree(self.files_dir)  # 清除上次运行生成的图层文件
+        os.makedirs(os.path.join(self.files_dir, 'detail'))
+        os.makedirs(os.path.join(self.files_dir, 'popup'))
+        self.index_lines = {} if keep_index else None  # 图层序号 -> layers.js中的一行
+        self.layers_file = None
+        if not keep_index:
+            self.layers_file = open(os.path.join(self.files_dir, 'layers.js'), 'w', encoding='utf-8')
+            self.layers_file.write("var BOUNDARY_LAYERS = [];\n")
+        self.layer_count = 0
+
+    def add_layer(self, layer):
+        """写入一个地块图层（不在内存中保留），返回图层序号"""
+        layer_id = self.layer_count
+        self.layer_count += 1
+
+        with open(os.path.join(self.files_dir, 'detail', f'{layer_id}.js'), 'w', encoding='utf-8') as f:
+            f.write(f"boundaryDetailLoaded({layer_id}, {layer['geojson']});\n")
+        with open(os.path.join(self.files_dir, 'popup', f'{layer_id}.js'), 'w', encoding='utf-8') as f:
+            f.write(f"boundaryPopupLoaded({layer_id}, {json.dumps(layer['popup'], ensure_ascii=False)});\n")
+
+        overview = layer.get('overview_geojson') or layer['geojson']
+        line = (
+            f"BOUNDARY_LAYERS.push({{\"id\": {layer_id}, "
+            f"\"name\": {json.dumps(layer['name'], ensure_ascii=False)}, "
+            f"\"marker\": {json.dumps(layer.get('marker'), ensure_ascii=False, default=_to_json_value)}, "
+            f"\"geojson\": {overview}}});\n"
+        )
+        if self.index_lines is not None:
+            self.index_lines[layer_id] = line
+        else:
+            self.layers_file.write(line)
+        return layer_id
+
+    def remove_layer(self, layer_id):
+        """删除一个地块图层（keep_index 模式）"""
+        del self.index_lines[layer_id]
+        for kind in ('detail', 'popup'):
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(self.files_dir, kind, f'{layer_id}.js'))
+
+    def write_index(self):
+        """按保留的图层重新写出 layers.js（keep_index 模式）"""
+        with open(os.path.join(self.files_dir, 'layers.js'), 'w', encoding='utf-8') as f:
+            f.write("var BOUNDARY_LAYERS = [];\n")
+            f.writelines(self.index_lines.values())
+
+    def close(self):
+        if self.layers_file is not None:
+            self.layers_file.close()
+
+    def attach_to(self, m):
+        """在地图中添加加载外部图层文件的脚本"""
+        m.add_child(ExternalBoundaryLayers(self.files_url))
+
+
+def run_boundary_check(folder_path, excel_file=None, output_excel=None, map_path=None,
+                       max_workers=None, incremental=True, show_gui=True, map_mode=MAP_MODE_INLINE,
+                       read_engine=None, use_arrow=False, popup_fields=POPUP_FIELDS_ALL, profile=None,
+                       progress_callback=None, streaming=False, fail_fast=False, check_overlaps=True,
+                       overlap_min_area=OVERLAP_MIN_AREA, prefetch_depth=PREFETCH_DEPTH,
+                       prefetch_memory_mb=PREFETCH_MEMORY_MB, repair_geometry=False,
+                       suggest_point=SUGGEST_POINT_CENTROID, boundary_layer=None, executor=None):
+    """边界文件检查主流程，返回检查统计信息
+
+    excel_file 为地块信息表路径（默认 folder_path/地块信息.xlsx）；output_excel 为保存result和统计信息工作表的
+    Excel路径（默认写回 excel_file）；map_path 为HTML地图路径；max_workers 为并行检查的进程数（默认使用全部CPU核心）；
+    incremental 为True时使用地块信息.xlsx旁的缓存，跳过未变化的ZIP文件；show_gui 为False时不弹出结果窗口；
+    map_mode 为 inline 时所有图层内嵌在HTML中，为 external 时图层写入HTML旁的外部文件并按需加载；
+    read_engine/use_arrow 指定读取shp的引擎和是否使用Arrow接口；popup_fields 为 required 时只读取检查需要的字段，
+    地图弹窗中也只显示这些字段；profile 为 cpu 时用cProfile分析主进程耗时，为 memory 时用tracemalloc记录各阶段峰值内存。
+    各阶段耗时写入结果Excel旁的耗时统计JSON文件，每个ZIP的耗时写入result工作表的 time_* 列。
+    progress_callback 为每完成一个ZIP调用一次的进度回调，参数为进度事件字典（见 ProgressTracker）。
+    streaming 为True时使用流式模式：结果记录按块写入磁盘、地图使用外部图层模式、缓存结果在合并时才读取、
+    并行检查只提前提交有限个任务，峰值内存不随ZIP数量增长；结果默认写入地块信息表旁的单独文件，不弹出结果窗口。
+    fail_fast 为True时先在主进程中快速预检查每个ZIP（只读中央目录和.shp文件头），有结构问题的ZIP直接报告，不再完整读取。
+    check_overlaps 为True时检查不同地块之间的边界重叠（面积不小于 overlap_min_area 平方米）和完全相同的边界，
+    结果写入result工作表的overlap列和“边界重叠”工作表。
+    prefetch_depth 大于0时用后台线程提前读取后续ZIP（最多 prefetch_depth 个，读取中和检查中的ZIP合计不超过
+    prefetch_memory_mb MB）并并行计算增量检查的文件指纹，使网络共享的读取延迟与检查重叠。
+    面图层的几何有效性（自相交、空几何、零面积）写入result工作表的validity列；repair_geometry 为True时用make_valid
+    修复无效几何后再做点面包含、中心点和重叠检查（问题仍会报告）。
+    未通过点面包含检查的地块，建议坐标（经度new/纬度new）按 suggest_point 计算：centroid 为面积加权中心点，
+    point_on_surface 保证落在面内；所有ZIP检查完成后按坐标系分组批量转换为经纬度。
+    ZIP中有多个shp时每个图层一行结果（按shp_file_relative区分），boundary_layer 为选择主边界图层的通配符
+    （如 *边界*，匹配shp_file_relative），不指定时取面积最大的面图层；附属图层不做申报坐标相关的检查。
+    executor 为常驻的检查进程池，多次调用时复用已启动的进程。
+    """
+    if excel_file is None:
+        excel_file = os.path.join(folder_path, "地块信息.xlsx")
+    if output_excel is None:
+        # 流式模式默认写入单独的结果文件，避免加载整个地块信息表
+        output_excel = os.path.splitext(excel_file)[0] + STREAM_RESULT_SUFFIX if streaming else excel_file
+    if map_path is None:
+        map_path = os.path.join(folder_path, "地块边界检查结果.html")
+
+    if max_workers is None:
+        max_workers = DEFAULT_MAX_WORKERS
+
+    # 性能分析（可选）和分阶段计时
+    profiler = None
+    if profile == PROFILE_CPU:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == PROFILE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    timer = StageTimer(trace_memory=profile == PROFILE_MEMORY)
+
+    # 读取地块信息并按地块编码建立索引
+    original_df, land_block_index, duplicate_codes = load_land_block_info(excel_file)
+    total_land_blocks = len(original_df)
+    timer.lap('load_excel')
+
+    # 创建结果累加器（按列收集，最后一次性生成DataFrame；流式模式按块写入磁盘）
+    if streaming:
+        results = ResultSpool(RESULT_COLUMNS + ZIP_TIMING_COLUMNS)
+        map_mode = MAP_MODE_EXTERNAL
+    else:
+        results = ResultTable(RESULT_COLUMNS + ZIP_TIMING_COLUMNS)
+
+    # 打开增量检查缓存
+    cache = None
+    if incremental:
         try:
-            from openpyxl import load_workbook
-            book = load_workbook(excel_file)
-            if 'result' in book.sheetnames:
-                del book['result']
-                book.save(excel_file)
+            cache = open_result_cache(os.path.join(os.path.dirname(excel_file), CACHE_FILE_NAME))
         except Exception as e:
-            print(f"清理Excel工作表时出错: {str(e)}")
-
-        # 写入新结果
-        with pd.ExcelWriter(excel_file, mode='a', engine='openpyxl') as writer:
-            result_df.to_excel(writer, sheet_name='result', index=False)
-        # 获取pass的数量
-        pass_count = result_df[result_df['result'] == 'pass'].shape[0]
-        # 获取"地块信息中未找到该地块编码"的数量
-        not_found_count = result_df[result_df['result'].str.contains('地块信息中未找到该地块编码', na=False)].shape[0]
-        # 获取cpg文件缺失的数量
-        cpg_missing_count = result_df[result_df['result'].str.contains('cpg文件缺失', na=False)].shape[0]
-        # 获取字段缺失的数量
-        field_missing_count = result_df[result_df['result'].str.contains('字段缺失|字段内容为空', na=False)].shape[
-            0]
-        # 获取几何类型错误的数量
-        geometry_error_count = result_df[result_df['result'].str.contains('几何类型错误', na=False)].shape[0]
-        # 获取坐标系问题的数量
-        crs_error_count = result_df[result_df['result'].str.contains('坐标系文件缺失|地理坐标系', na=False)].shape[
-            0]
-        in_polygon_count = result_df[result_df['result'].str.contains('地块位置不在边界范围内', na=False)].shape[0]
-        # 创建统计信息
-        stats_data = {
-            '统计项': [
-                '地块信息的地块编码数量',
-                'zip文件数量',
-                '去重地块编码后zip文件数量',
-                'PASS地块数量',
-                '未对应地块编码的zip数量',
-                'cpg文件缺失的数量',
-                '字段问题的数量',
-                '几何类型错误的数量',
-                '坐标系问题的数量',
-                '地块位置不在边界范围的数量'
-            ],
-            '数量': [
-                total_land_blocks,
-                len(zip_files),
-                len(zip_by_land_block),
-                pass_count,
-                not_found_count,
-                cpg_missing_count,
-                field_missing_count,
-                geometry_error_count,
-                crs_error_count,
-                in_polygon_count
-            ]
-        }
-        stats_df = pd.DataFrame(stats_data)
+            print(f"打开检查结果缓存失败，将完整检查所有ZIP: {str(e)}")
+
+    # 创建地图
+    m = create_result_map()
+    map_writer = ExternalMapWriter(map_path) if map_mode == MAP_MODE_EXTERNAL else None
+
+    # 收集所有zip文件（排序以保证结果顺序确定）
+    zip_files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith('.zip'))
+
+    # 按地块编码分组ZIP文件
+    zip_by_land_block = defaultdict(list)
+    for zf in zip_files:
+        land_block_code = extract_land_block_code(zf)
+        if land_block_code:
+            zip_by_land_block[land_block_code].append(zf)
+
+    task_options = zip_task_options(popup_fields, read_engine, use_arrow, repair_geometry, suggest_point,
+                                    boundary_layer, check_overlaps, map_mode == MAP_MODE_EXTERNAL)
+
+    # 预读模式下用后台线程并行计算增量检查的ZIP文件指纹（大小和修改时间与缓存记录一致的ZIP需要读取整个文件）
+    fingerprints = {}
+    if cache is not None and prefetch_depth > 0:
+        fingerprints = prefetch_fingerprints(cache, folder_path, [
+            zip_file for land_block_code, zip_list in zip_by_land_block.items()
+            if land_block_code in land_block_index for zip_file in zip_list], prefetch_depth)
+
+    # 生成检查任务（每个ZIP独立处理），未匹配地块编码的ZIP直接生成结果记录
+    tasks = []
+    cached_count = 0
+    precheck_failed_count = 0
+    ordered_items = []  # 按处理顺序保存 ([(结果记录, 地图图层), ...], 检查任务)，用于合并并行结果和缓存结果
+    for land_block_code, zip_list in zip_by_land_block.items():
+        # 检查地块编码是否在原始数据中（哈希索引查找）
+        row = land_block_index.get(land_block_code)
+        if row is None:
+            # 记录未匹配到地块信息的ZIP
+            for zip_file in zip_list:
+                ordered_items.append(([(land_block_not_found_result(zip_file, land_block_code), None)], None))
+            continue
+
+        # 处理该地块编码对应的所有ZIP文件
+        for zip_file in zip_list:
+            task = zip_task(folder_path, zip_file, land_block_code, row, zip_list, duplicate_codes, task_options)
+
+            # 快速预检查：有结构问题的ZIP直接报告，不再提交完整检查
+            if fail_fast:
+                result_dict = precheck_result(task)
+                if result_dict is not None:
+                    ordered_items.append(([(result_dict, None)], None))
+                    precheck_failed_count += 1
+                    continue
+
+            # 增量检查：ZIP文件和地块信息都未变化时直接复用缓存的结果（流式模式在合并时才读取缓存内容）
+            if cache is not None:
+                try:
+                    task['fingerprint'] = (fingerprints.get(task['zip_path']) or
+                                           zip_fingerprint(task['zip_path'], cached_zip_stat(cache, zip_file)))
+                except OSError as e:
+                    # ZIP在列出文件后被删除、改名或为失效链接：不使用缓存，由检查报告解压错误
+                    print(f"无法读取 {zip_file} 的文件信息，不使用缓存: {str(e)}")
+            if 'fingerprint' in task:
+                if streaming:
+                    if has_cached_result(cache, task):
+                        ordered_items.append((None, dict(task, cached=True)))
+                        cached_count += 1
+                        continue
+                else:
+                    cached = lookup_cached_result(cache, task)
+                    if cached is not None:
+                        ordered_items.append((cached, None))
+                        cached_count += 1
+                        continue
+
+            tasks.append(task)
+            ordered_items.append((None, task))
+
+    if fail_fast:
+        print(f"快速预检查：{precheck_failed_count} 个ZIP存在结构问题，不再完整读取")
+    if cache is not None:
+        print(f"增量检查：复用缓存结果 {cached_count} 个，需要检查 {len(tasks)} 个")
+    timer.lap('prepare')
+
+    # 执行检查，并按确定的顺序合并结果和地图图层
+    progress = ProgressTracker(len(ordered_items), progress_callback) if progress_callback is not None else None
+    cache_stats = {}  # 各检查进程的坐标转换器/坐标系缓存统计，写入耗时统计
+    check_results = run_zip_checks(tasks, max_workers, max_pending=max_workers * 4 if streaming else None,
+                                   prefetch_depth=prefetch_depth, prefetch_memory_mb=prefetch_memory_mb,
+                                   executor=executor, cache_stats=cache_stats)
+    footprints = FootprintStore(spool=streaming)  # 跨地块重叠检查使用的地块范围（流式模式写入磁盘）
+    suggested_points = []  # 未通过地块的代表点（图层坐标系），检查完成后按坐标系分组批量转换
+    encoding_sources = Counter()  # 各编码检测依据的图层数量，写入耗时统计
+    try:
+        for zip_results, task in ordered_items:
+            if task is not None and task.get('cached'):
+                zip_results = lookup_cached_result(cache, task) or check_zip_file(task)
+            elif task is not None:
+                with timer.stage('check'):
+                    zip_results = next(check_results)
+                if 'fingerprint' in task:
+                    with timer.stage('cache_store'):
+                        try:
+                            complete_fingerprint(task)
+                        except OSError:
+                            pass  # ZIP在检查后被删除或无法读取：不保存缓存，下次重新检查
+                        else:
+                            store_cached_result(cache, task, zip_results)
+                            if streaming and len(results) % STREAM_CHUNK_SIZE == 0:
+                                cache.commit()
+            for result_dict, layer in zip_results:
+                if result_dict.get('encoding_source'):
+                    encoding_sources[result_dict['encoding_source']] += 1
+                suggested_point = result_dict.pop('suggested_point', None)
+                if suggested_point is not None:
+                    suggested_points.append((len(results), suggested_point))
+                if check_overlaps and layer is not None and layer.get('footprint'):
+                    footprints.append(len(results), result_dict['zip_file_name'], result_dict['地块编码'],
+                                      layer['footprint'])
+                if layer is not None:
+                    with timer.stage('map_build'):
+                        if map_writer is not None:
+                            map_writer.add_layer(layer)
+                        else:
+                            add_layer_to_map(m, layer)
+                results.append(result_dict)
+            if progress is not None:
+                progress.update(result_dict['zip_file_name'])
+    finally:
+        if cache is not None:
+            cache.commit()
+            cache.close()
+
+    # 未通过地块的建议坐标：按坐标系分组批量转换为经纬度
+    for index, issues, values in convert_suggested_points(suggested_points, cache_stats):
+        results.add_issues(index, issues, **values)
+    del suggested_points
+    timer.lap('suggest_coords')
+
+    # 跨地块检查：所有ZIP检查完成后，用一棵空间索引查找不同地块之间的边界重叠和完全相同的边界
+    overlap_df = None
+    if check_overlaps:
+        overlaps = find_parcel_overlaps(footprints, overlap_min_area)
+        # 没有重叠的地块只记一个默认值，流式模式下不为每个地块保存一条追加记录
+        results.fill_default(footprints.indexes, overlap='无重叠')
+        for index, (issues, text) in overlap_annotations(overlaps).items():
+            results.add_issues(index, issues, overlap=text)
+        overlap_df = overlap_dataframe(overlaps)
+        if overlaps:
+            print(f"跨地块检查：发现 {len(overlaps)} 对地块边界重叠或完全相同")
+    footprints.close()
+    del footprints
+    timer.lap('overlap')
+
+    if streaming:
+        result_df = None
+        result_sheet = results
+        timing_df = results.to_dataframe(['zip_file_name'] + ZIP_TIMING_COLUMNS)
+    else:
+        result_df = result_sheet = timing_df = results.to_dataframe()
+    summary_counts = results.summary_counts()
+    timer.lap('merge_results')
+
+    if map_writer is not None:
+        # 外部图层模式：完成图层文件写入，地图中只保留按需加载脚本
+        map_writer.close()
+        map_writer.attach_to(m)
+    else:
+        # 添加图层控制（如果地图上有多个图层）
+        folium.LayerControl().add_to(m)
+    timer.lap('map_build')
+
+    # 保存结果到Excel的result和统计信息工作表
+    stats_items = check_stats_items(total_land_blocks, len(duplicate_codes), len(zip_files), len(zip_by_land_block),
+                                    summary_counts, overlap_df)
+    save_result_sheets(output_excel, excel_file, result_sheet, stats_items, overlap_df)
+    timer.lap('excel_write')
+
+    if streaming:
+        results.close()
+
+    # 显示结果（流式模式不在内存中保留结果表，不弹出结果窗口）
+    if show_gui and tk is not None and result_df is not None:
+        show_dataframe_in_window(result_df, "边界文件检查结果")
+        timer.lap('show_gui')
+
+    # 保存地图
+    save_map(m, map_path)
+    timer.lap('map_save')
+
+    # 保存耗时统计（和可选的性能分析结果）
+    write_timing_summary(output_excel, timer, timing_df, profiler, {
+        'rules_version': CHECK_RULES_VERSION,
+        'folder': os.path.abspath(folder_path),
+        'workers': max_workers,
+        'zip_count': len(ordered_items),
+        'layer_count': len(results),
+        'checked_count': len(tasks),
+        'cached_count': cached_count,
+        'precheck_failed_count': precheck_failed_count,
+        'encoding_sources': dict(encoding_sources),
+        'streaming': streaming,
+        # 坐标转换和坐标系解析在检查进程中进行，按ZIP汇总各进程的命中次数（size 为单个进程中最大的缓存大小）
+        'transformer_cache': cache_stats.get('transformer_cache'),
+        'crs_cache': cache_stats.get('crs_cache'),
+    })
+
+    return {
+        'zip_count': len(ordered_items),
+        'layer_count': len(results),
+        'pass_count': summary_counts[PASS_STATS_NAME],
+        'failed_count': len(results) - summary_counts[PASS_STATS_NAME],
+        'result_df': result_df,
+    }
+
+
+def _sheet_rows(df, header_cell=None):
+    """逐行生成工作表内容（表头 + 数据行），缺失值写为空单元格；df 也可以是 ResultSpool"""
+    yield [header_cell(col) if header_cell else col for col in df.columns]
+    if isinstance(df, ResultSpool):
+        yield from df.iter_rows()
+        return
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        yield list(row)
+
+
+def write_result_workbook(output_excel, sheets, keep_existing=True):
+    """将 {工作表名: DataFrame或ResultSpool} 写入Excel，只保存一次
+
+    keep_existing 为True且文件已存在时（结果写回地块信息表），只加载、保存工作簿一次，同名工作表原位替换，
+    其他工作表保留；否则用openpyxl只写模式新建工作簿逐行写入，内存占用不随结果行数增长。
+    """
+    if keep_existing and os.path.exists(output_excel):
+        book = load_workbook(output_excel)
+        for sheet_name, df in sheets.items():
+            index = None
+            if sheet_name in book.sheetnames:
+                index = book.sheetnames.index(sheet_name)
+                del book[sheet_name]
+            sheet = book.create_sheet(sheet_name, index)
+            for row in _sheet_rows(df):
+                sheet.append(row)
+            for cell in sheet[1]:
+                cell.font = Font(bold=True)
+    else:
+        book = Workbook(write_only=True)
+        for sheet_name, df in sheets.items():
+            sheet = book.create_sheet(sheet_name)
+
+            def header_cell(value, sheet=sheet):
+                cell = WriteOnlyCell(sheet, value=value)
+                cell.font = Font(bold=True)
+                return cell
+
+            for row in _sheet_rows(df, header_cell):
+                sheet.append(row)
+    book.save(output_excel)
+
+
+def check_stats_items(total_land_blocks, duplicate_count, zip_count, group_count, summary_counts, overlap_df=None):
+    """生成统计信息工作表的 [(统计项, 数量), ...]（各问题数量在结果累加器中一次遍历统计）"""
+    stats_items = [
+        ('地块信息的地块编码数量', total_land_blocks),
+        ('地块信息中重复的地块编码数量', duplicate_count),
+        ('zip文件数量', zip_count),
+        ('去重地块编码后zip文件数量', group_count),
+    ] + list(summary_counts.items())
+    if overlap_df is not None:
+        stats_items.append(('边界重叠或完全相同的地块对数量', len(overlap_df)))
+    return stats_items
+
+
+def save_result_sheets(output_excel, excel_file, result_sheet, stats_items, overlap_df=None):
+    """打印统计信息，并将result、统计信息（和边界重叠）工作表一次写入结果Excel（出错时只输出错误）"""
+    try:
+        stats_df = pd.DataFrame(stats_items, columns=['统计项', '数量'])
         # 打印统计信息
         print("\n" + "=" * 60)
         print("边界文件检查情况")
@@ -757,33 +2750,26 @@ def main():
         print("-" * 45)
 
         # 格式化输出每个统计项
-        print(f"{'地块信息的地块编码数量':} | {total_land_blocks:}")
-        print(f"{'zip文件数量':} | {len(zip_files):}")
-        print(f"{'去重地块编码后zip文件数量':} | {len(zip_by_land_block):}")
-        print(f"{'PASS地块数量':} | {pass_count:}")
-        print(f"{'未对应地块编码的zip数量':} | {not_found_count:}")
-        print(f"{'cpg文件缺失的数量':} | {cpg_missing_count:>}")
-        print(f"{'字段问题的数量':} | {field_missing_count:>}")
-        print(f"{'几何类型错误的数量':} | {geometry_error_count:}")
-        print(f"{'坐标系问题的数量':} | {crs_error_count:}")
-        print(f"{'地块位置不在边界范围的数量':} | {in_polygon_count:}")
+        for stats_name, stats_count in stats_items:
+            print(f"{stats_name} | {stats_count}")
         print("-" * 45)
-        # 将统计信息保存到新的工作表
-        with pd.ExcelWriter(excel_file, mode='a', engine='openpyxl', if_sheet_exists='replace') as writer:
-            stats_df.to_excel(writer, sheet_name='统计信息', index=False)
-        print(f"检查结果已保存到 {excel_file} 的 'result' 工作表")
-        # print(len(result_df[(result_df['shp_file_relative'].fillna('').astype(str).str.strip() == '') & (
-        #             result_df['地块编码'].fillna('').astype(str).str.strip() != '')]))
-        print(f"统计信息已保存到 {excel_file} 的 '统计信息' 工作表")
+        # 两个工作表一次写入：写回地块信息表时只打开、保存一次，输出到单独文件时逐行流式写入
+        sheets = {'result': result_sheet, '统计信息': stats_df}
+        if overlap_df is not None:
+            sheets['边界重叠'] = overlap_df
+        write_result_workbook(output_excel, sheets,
+                              keep_existing=os.path.abspath(output_excel) == os.path.abspath(excel_file))
+        print(f"检查结果已保存到 {output_excel} 的 'result' 工作表")
+        print(f"统计信息已保存到 {output_excel} 的 '统计信息' 工作表")
+        if overlap_df is not None:
+            print(f"边界重叠检查结果已保存到 {output_excel} 的 '边界重叠' 工作表")
 
     except Exception as e:
         print(f"保存结果时出错: {str(e)}")
 
-    # 显示结果
-    show_dataframe_in_window(result_df, "边界文件检查结果")
 
-    # 保存地图
-    map_path = os.path.join(folder_path, "地块边界检查结果.html")
+def save_map(m, map_path):
+    """保存HTML地图，生成失败或文件过小时写入说明可能原因的备用HTML"""
     try:
         m.save(map_path)
         print(f"地图已保存至: {map_path}")
@@ -816,7 +2802,7 @@ def main():
     except Exception as e:
         print(f"保存地图时出错: {str(e)}")
         # 创建一个简单的HTML文件作为备份
-        backup_html = os.path.join(folder_path, "地块边界检查结果.html")
+        backup_html = map_path
         with open(backup_html, 'w', encoding='utf-8') as f:
             f.write("""
             <!DOCTYPE html>
@@ -840,5 +2826,564 @@ def main():
         print(f"已创建备用HTML文件: {backup_html}")
 
 
+def write_timing_summary(output_excel, timer, result_df, profiler=None, run_info=None):
+    """将各阶段耗时、各ZIP耗时汇总和性能分析结果保存到结果Excel旁的JSON文件，并打印耗时最多的阶段"""
+    output_base = os.path.splitext(output_excel)[0]
+    stage_summary, slowest_zips = summarize_zip_timings(result_df, ZIP_TIMING_STAGES)
+    summary = dict(run_info or {})
+    summary.update({
+        'total_seconds': round(timer.elapsed(), 4),
+        'stages': {name: round(seconds, 4) for name, seconds in timer.seconds.items()},
+        'zip_stages': stage_summary,
+        'slowest_zips': slowest_zips,
+    })
+
+    if profiler is not None:
+        profiler.disable()
+        profile_path = output_base + PROFILE_FILE_SUFFIX
+        profiler.dump_stats(profile_path)
+        summary['profile_path'] = profile_path
+        print(f"\ncProfile性能分析结果已保存到 {profile_path}，累计耗时最多的函数：")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        if summary.get('workers', 1) > 1:
+            print("提示：多进程模式下cProfile只分析主进程，分析单个ZIP的检查耗时请使用 -j 1")
+
+    if timer.trace_memory:
+        summary['peak_memory_mb'] = {name: round(peak / 1024 / 1024, 2) for name, peak in timer.peak_memory.items()}
+        summary['top_allocations'] = [
+            {'location': str(stat.traceback), 'size_mb': round(stat.size / 1024 / 1024, 3), 'count': stat.count}
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:15]
+        ]
+        tracemalloc.stop()
+
+    print("\n各阶段耗时（秒）：" + "，".join(
+        f"{name} {seconds:.2f}" for name, seconds in sorted(timer.seconds.items(), key=lambda item: -item[1])))
+    timing_path = output_base + TIMING_FILE_SUFFIX
+    try:
+        with open(timing_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=_to_json_value)
+        print(f"耗时统计已保存到 {timing_path}")
+    except Exception as e:
+        print(f"保存耗时统计时出错: {str(e)}")
+    return summary
+
+
+def scan_watch_folder(folder_path, excel_file):
+    """返回文件夹中 *X.zip 和地块信息表的 {路径: (大小, 修改时间ns)}，只读取目录项，不打开文件"""
+    snapshot = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith('.zip') and extract_land_block_code(entry.name):
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    try:
+        stat = os.stat(excel_file)
+        snapshot[excel_file] = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        pass
+    return snapshot
+
+
+class WatchSession:
+    """监视模式的常驻检查状态：保留各ZIP的结果记录、地图图层和跨地块重叠记录，每轮只检查变化的ZIP
+
+    每轮按文件快照（见 scan_watch_folder）找出新增、修改（大小或修改时间变化）以及地块信息行或点标记变化的ZIP，
+    只检查这些ZIP并替换它们的结果行和地图图层，删除的ZIP移除对应的结果和图层；跨地块重叠检查只查找与这些ZIP
+    有关的地块对，其余地块对沿用之前的结果。首轮所有ZIP都经过增量检查缓存（未变化的直接复用上次运行的结果），
+    之后各轮不再读取未变化ZIP的缓存。结果Excel和HTML地图每轮按保留的结果写出（外部图层模式只写入变化的图层文件
+    和图层索引）。参数与 run_boundary_check 相同，executor 为常驻的检查进程池；流式模式下地图使用外部图层模式。
+    """
+
+    def __init__(self, folder_path, executor, excel_file=None, output_excel=None, map_path=None, max_workers=None,
+                 incremental=True, map_mode=MAP_MODE_INLINE, read_engine=None, use_arrow=False,
+                 popup_fields=POPUP_FIELDS_ALL, profile=None, streaming=False, fail_fast=False, check_overlaps=True,
+                 overlap_min_area=OVERLAP_MIN_AREA, prefetch_depth=PREFETCH_DEPTH,
+                 prefetch_memory_mb=PREFETCH_MEMORY_MB, repair_geometry=False,
+                 suggest_point=SUGGEST_POINT_CENTROID, boundary_layer=None):
+        self.folder_path = folder_path
+        self.executor = executor
+        self.excel_file = excel_file or os.path.join(folder_path, "地块信息.xlsx")
+        self.output_excel = output_excel or os.path.splitext(self.excel_file)[0] + STREAM_RESULT_SUFFIX
+        self.map_path = map_path or os.path.join(folder_path, "地块边界检查结果.html")
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        self.incremental = incremental
+        self.profile = profile
+        self.fail_fast = fail_fast
+        self.check_overlaps = check_overlaps
+        self.overlap_min_area = overlap_min_area
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_memory_mb = prefetch_memory_mb
+        self.task_options = zip_task_options(popup_fields, read_engine, use_arrow, repair_geometry, suggest_point,
+                                             boundary_layer, check_overlaps,
+                                             map_mode == MAP_MODE_EXTERNAL or streaming)
+
+        self.map = create_result_map()
+        self.map_writer = None
+        if map_mode == MAP_MODE_EXTERNAL or streaming:
+            self.map_writer = ExternalMapWriter(self.map_path, keep_index=True)
+            self.map_writer.attach_to(self.map)
+
+        self.land_blocks = None  # load_land_block_info 的结果
+        self.excel_stat = None  # 读取地块信息表时的 (大小, 修改时间ns)
+        # ZIP文件名 -> {'stat': 检查时快照中的(大小, 修改时间ns), 'row_key': 任务行键, 'results': [结果记录, ...],
+        #              'footprints': [(结果位置, WGS84地块范围)], 'map': [地图元素或外部图层序号]}
+        self.entries = {}
+        self.overlaps = []  # 跨地块重叠记录，'a'/'b' 为 (ZIP文件名, 结果位置)
+        self.overlap_pending = set()  # 结果已替换但尚未重新检查重叠的ZIP（本轮出错时下一轮继续）
+        self.map_saved = False
+
+    def run_round(self, snapshot, progress_callback=None):
+        """按文件快照运行一轮检查，写出结果Excel和地图，返回检查统计信息（同 run_boundary_check）"""
+        profiler = None
+        if self.profile == PROFILE_CPU:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        elif self.profile == PROFILE_MEMORY and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        timer = StageTimer(trace_memory=self.profile == PROFILE_MEMORY)
+
+        # 地块信息表变化时重新读取，地块信息行变化的ZIP由任务行键比较找出
+        excel_stat = snapshot.get(self.excel_file)
+        if self.land_blocks is None or excel_stat != self.excel_stat:
+            self.land_blocks = load_land_block_info(self.excel_file)
+            self.excel_stat = excel_stat
+        original_df, land_block_index, duplicate_codes = self.land_blocks
+        timer.lap('load_excel')
+
+        zip_files = sorted(f for f in os.listdir(self.folder_path) if f.lower().endswith('.zip'))
+        zip_by_land_block = defaultdict(list)
+        for zf in zip_files:
+            land_block_code = extract_land_block_code(zf)
+            if land_block_code:
+                zip_by_land_block[land_block_code].append(zf)
+        zip_order = [zip_file for zip_list in zip_by_land_block.values() for zip_file in zip_list]
+        present = set(zip_order)
+        removed = [zip_file for zip_file in self.entries if zip_file not in present]
+
+        # 找出需要更新的ZIP：新增、大小或修改时间变化、地块信息行或检查选项变化
+        updates = {}  # ZIP文件名 -> [快照中的文件信息, 任务行键, [(结果记录, 地图图层), ...]（待检查时为None）]
+        candidates = []
+        precheck_failed_count = 0
+        for land_block_code, zip_list in zip_by_land_block.items():
+            row = land_block_index.get(land_block_code)
+            for zip_file in zip_list:
+                task = None
+                if row is not None:
+                    task = zip_task(self.folder_path, zip_file, land_block_code, row, zip_list, duplicate_codes,
+                                    self.task_options)
+                row_key = _task_row_key(task) if task is not None else None
+                entry = self.entries.get(zip_file)
+                if entry is not None and entry['stat'] == snapshot.get(zip_file) and entry['row_key'] == row_key:
+                    continue
+                updates[zip_file] = [snapshot.get(zip_file), row_key, None]
+                if task is None:
+                    updates[zip_file][2] = [(land_block_not_found_result(zip_file, land_block_code), None)]
+                    continue
+                if self.fail_fast:
+                    result_dict = precheck_result(task)
+                    if result_dict is not None:
+                        updates[zip_file][2] = [(result_dict, None)]
+                        precheck_failed_count += 1
+                        continue
+                candidates.append(task)
+
+        cache = None
+        if self.incremental:
+            try:
+                cache = open_result_cache(os.path.join(os.path.dirname(self.excel_file), CACHE_FILE_NAME))
+            except Exception as e:
+                print(f"打开检查结果缓存失败，将完整检查变化的ZIP: {str(e)}")
+        tasks = []
+        cached_count = 0
+        cache_stats = {}
+        try:
+            # 只为变化的ZIP查找缓存（如文件恢复为之前检查过的版本）
+            fingerprints = {}
+            if cache is not None and self.prefetch_depth > 0 and len(candidates) > 1:
+                fingerprints = prefetch_fingerprints(cache, self.folder_path, [task['zip_file'] for task in candidates],
+                                                     self.prefetch_depth)
+            for task in candidates:
+                if cache is not None:
+                    try:
+                        task['fingerprint'] = (fingerprints.get(task['zip_path']) or
+                                               zip_fingerprint(task['zip_path'], cached_zip_stat(cache, task['zip_file'])))
+                    except OSError as e:
+                        print(f"无法读取 {task['zip_file']} 的文件信息，不使用缓存: {str(e)}")
+                if 'fingerprint' in task:
+                    cached = lookup_cached_result(cache, task)
+                    if cached is not None:
+                        updates[task['zip_file']][2] = cached
+                        cached_count += 1
+                        continue
+                tasks.append(task)
+            print(f"监视模式：本轮检查 {len(tasks)} 个ZIP，复用缓存结果 {cached_count} 个，移除 {len(removed)} 个，"
+                  f"其余 {len(zip_order) - len(updates)} 个ZIP未变化")
+            timer.lap('prepare')
+
+            progress = ProgressTracker(len(tasks), progress_callback) if progress_callback and tasks else None
+            check_results = run_zip_checks(tasks, self.max_workers, prefetch_depth=self.prefetch_depth,
+                                           prefetch_memory_mb=self.prefetch_memory_mb, executor=self.executor,
+                                           cache_stats=cache_stats)
+            for task in tasks:
+                with timer.stage('check'):
+                    zip_results = next(check_results)
+                if 'fingerprint' in task:
+                    with timer.stage('cache_store'):
+                        try:
+                            complete_fingerprint(task)
+                        except OSError:
+                            pass  # ZIP在检查后被删除或无法读取：不保存缓存，下次重新检查
+                        else:
+                            store_cached_result(cache, task, zip_results)
+                updates[task['zip_file']][2] = zip_results
+                if progress is not None:
+                    progress.update(task['zip_file'])
+        finally:
+            if cache is not None:
+                cache.commit()
+                cache.close()
+
+        # 本轮更新的结果：建议坐标按坐标系分组批量转换
+        suggested_points = []
+        for _, _, zip_results in updates.values():
+            for result_dict, _ in zip_results:
+                suggested_point = result_dict.pop('suggested_point', None)
+                if suggested_point is not None:
+                    suggested_points.append((result_dict, suggested_point))
+        for result_dict, issues, values in convert_suggested_points(suggested_points, cache_stats):
+            result_dict['issues'] = result_dict['issues'] + issues
+            result_dict.update(values)
+        timer.lap('suggest_coords')
+
+        # 替换变化ZIP的结果和地图图层
+        self.overlap_pending.update(updates, removed)
+        for zip_file in removed:
+            self._remove_entry(zip_file)
+        for zip_file, (stat, row_key, zip_results) in updates.items():
+            self._set_entry(zip_file, stat, row_key, zip_results)
+        timer.lap('map_build')
+
+        # 跨地块检查：去掉涉及变化ZIP的地块对，只查找与变化ZIP有关的地块对
+        overlap_df = None
+        annotations = {}
+        if self.check_overlaps:
+            self.overlaps = [overlap for overlap in self.overlaps if overlap['zip_a'] not in self.overlap_pending
+                             and overlap['zip_b'] not in self.overlap_pending]
+            footprints = FootprintStore()
+            only = set()
+            for zip_file in zip_order:
+                entry = self.entries[zip_file]
+                for position, footprint in entry['footprints']:
+                    if zip_file in self.overlap_pending:
+                        only.add(len(footprints))
+                    footprints.append((zip_file, position), zip_file, entry['results'][position]['地块编码'], footprint)
+            self.overlaps += find_parcel_overlaps(footprints, self.overlap_min_area, only)
+            order = {index: position for position, index in enumerate(footprints.indexes)}
+            self.overlaps.sort(key=lambda overlap: (order[overlap['a']], order[overlap['b']]))
+            annotations = overlap_annotations(self.overlaps)
+            overlap_df = overlap_dataframe(self.overlaps)
+        self.overlap_pending = set()
+        timer.lap('overlap')
+
+        # 按ZIP顺序生成结果表（未变化的ZIP沿用保留的结果记录）
+        results = ResultTable(RESULT_COLUMNS + ZIP_TIMING_COLUMNS)
+        for zip_file in zip_order:
+            entry = self.entries[zip_file]
+            footprint_positions = {position for position, _ in entry['footprints']}
+            for position, result_dict in enumerate(entry['results']):
+                if position in footprint_positions:
+                    issues, text = annotations.get((zip_file, position), ([], '无重叠'))
+                    result_dict = dict(result_dict, issues=result_dict['issues'] + issues, overlap=text)
+                results.append(result_dict)
+        result_df = results.to_dataframe()
+        summary_counts = results.summary_counts()
+        timer.lap('merge_results')
+
+        stats_items = check_stats_items(len(original_df), len(duplicate_codes), len(zip_files), len(zip_by_land_block),
+                                        summary_counts, overlap_df)
+        save_result_sheets(self.output_excel, self.excel_file, result_df, stats_items, overlap_df)
+        timer.lap('excel_write')
+
+        # 地图只在有图层变化时重新保存（如只修改了地块信息表中未匹配ZIP的行）
+        if updates or removed or not self.map_saved:
+            if self.map_writer is not None:
+                self.map_writer.write_index()
+                save_map(self.map, self.map_path)
+            else:
+                control = folium.LayerControl().add_to(self.map)
+                save_map(self.map, self.map_path)
+                # 图层控件在保存时才收集图层，下一轮新增的图层要排在控件之前，保存后移除
+                del self.map._children[control.get_name()]
+            self.map_saved = True
+        timer.lap('map_save')
+
+        # 耗时统计只包含本轮检查的ZIP
+        checked_rows = [result_dict for task in tasks for result_dict in self.entries[task['zip_file']]['results']]
+        timing_columns = ['zip_file_name'] + ZIP_TIMING_COLUMNS
+        timing_df = pd.DataFrame([[row.get(col) for col in timing_columns] for row in checked_rows],
+                                 columns=timing_columns)
+        write_timing_summary(self.output_excel, timer, timing_df, profiler, {
+            'rules_version': CHECK_RULES_VERSION,
+            'folder': os.path.abspath(self.folder_path),
+            'workers': self.max_workers,
+            'watch': True,
+            'zip_count': len(zip_order),
+            'layer_count': len(results),
+            'checked_count': len(tasks),
+            'cached_count': cached_count,
+            'removed_count': len(removed),
+            'precheck_failed_count': precheck_failed_count,
+            'encoding_sources': dict(Counter(row['encoding_source'] for row in checked_rows
+                                             if row.get('encoding_source'))),
+            'transformer_cache': cache_stats.get('transformer_cache'),
+            'crs_cache': cache_stats.get('crs_cache'),
+        })
+
+        return {
+            'zip_count': len(zip_order),
+            'layer_count': len(results),
+            'pass_count': summary_counts[PASS_STATS_NAME],
+            'failed_count': len(results) - summary_counts[PASS_STATS_NAME],
+            'result_df': result_df,
+        }
+
+    def _set_entry(self, zip_file, stat, row_key, zip_results):
+        """替换一个ZIP的结果记录、地块范围和地图图层"""
+        self._remove_entry(zip_file)
+        entry = {'stat': stat, 'row_key': row_key, 'results': [], 'footprints': [], 'map': []}
+        for position, (result_dict, layer) in enumerate(zip_results):
+            entry['results'].append(result_dict)
+            if layer is None:
+                continue
+            if self.check_overlaps and layer.get('footprint'):
+                entry['footprints'].append((position, shapely.from_wkb(layer['footprint'])))
+            if self.map_writer is not None:
+                entry['map'].append(self.map_writer.add_layer(layer))
+            else:
+                entry['map'].extend(add_layer_to_map(self.map, layer))
+        self.entries[zip_file] = entry
+
+    def _remove_entry(self, zip_file):
+        """移除一个ZIP的结果记录和地图图层"""
+        entry = self.entries.pop(zip_file, None)
+        if entry is None:
+            return
+        for element in entry['map']:
+            if self.map_writer is not None:
+                self.map_writer.remove_layer(element)
+            else:
+                del self.map._children[element.get_name()]
+
+
+def run_watch_round(session, snapshot, progress_callback=None):
+    """监视模式下运行一轮检查，返回退出码
+
+    出错时输出错误和调用栈，等待文件变化后重试（本轮未完成的ZIP下一轮重新检查）；
+    检查进程异常退出（BrokenProcessPool）时向上抛出，由 watch_folder 重建进程池。
+    """
+    start = time.perf_counter()
+    try:
+        summary = session.run_round(snapshot, progress_callback)
+    except BrokenProcessPool:
+        raise
+    except SystemExit:
+        print("本轮检查未完成（见上方错误信息），文件变化后将重新检查")
+        return EXIT_ERROR
+    except Exception:
+        print(f"本轮检查出错，文件变化后将重新检查:\n{traceback.format_exc()}", file=sys.stderr)
+        return EXIT_ERROR
+    layers = f"（{summary['layer_count']} 个图层）" if summary['layer_count'] != summary['zip_count'] else ""
+    print(f"[{time.strftime('%H:%M:%S')}] 本轮检查完成，用时 {format_duration(time.perf_counter() - start)}：共 "
+          f"{summary['zip_count']} 个ZIP{layers}，通过 {summary['pass_count']} 个，未通过 {summary['failed_count']} 个")
+    return EXIT_PASS if summary['failed_count'] == 0 else EXIT_FAILED
+
+
+def watch_folder(folder_path, run_kwargs, interval=WATCH_INTERVAL_SECONDS, progress_callback=None, max_rounds=None):
+    """监视模式：常驻进程定期扫描文件夹，ZIP新增、修改、删除或地块信息表变化且写入完成后运行一轮检查
+
+    各轮之间保留已导入的模块、主进程和检查进程中的坐标系/转换器/编码缓存、文件哈希缓存、常驻的检查进程池，
+    以及各ZIP的结果和地图图层（见 WatchSession），每轮只检查变化的ZIP，再更新结果Excel和地图。
+    结果默认写入地块信息表旁的单独文件（不修改正在编辑的地块信息表）。某一轮出错时输出调用栈，文件再次变化时重试。
+    max_rounds 为检查轮数上限，默认一直运行，按 Ctrl+C 退出。返回最后一轮的退出码。
+    """
+    run_kwargs = dict(run_kwargs, incremental=True)
+    excel_file = run_kwargs.get('excel_file') or os.path.join(folder_path, "地块信息.xlsx")
+    if run_kwargs.get('output_excel') is None:
+        run_kwargs['output_excel'] = os.path.splitext(excel_file)[0] + STREAM_RESULT_SUFFIX
+    writes_excel = os.path.abspath(run_kwargs['output_excel']) == os.path.abspath(excel_file)
+    max_workers = run_kwargs.get('max_workers') or DEFAULT_MAX_WORKERS
+
+    checked = None  # 上一轮检查时的文件快照
+    previous = None  # 上一次扫描的文件快照
+    rounds = 0
+    exit_code = EXIT_PASS
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    session = WatchSession(folder_path, executor, **run_kwargs)
+    print(f"监视模式：每 {interval:g} 秒扫描一次 {folder_path}，按 Ctrl+C 退出")
+    try:
+        while max_rounds is None or rounds < max_rounds:
+            current = scan_watch_folder(folder_path, excel_file)
+            # 首轮直接检查；之后文件有变化、且在一个扫描间隔内保持不变（复制完成）时检查
+            if current != checked and (checked is None or current == previous):
+                if checked is not None:
+                    added = [name for name in current if name not in checked]
+                    changed = [name for name in current if name in checked and current[name] != checked[name]]
+                    removed = [name for name in checked if name not in current]
+                    print(f"[{time.strftime('%H:%M:%S')}] 检测到文件变化：新增 {len(added)} 个，修改 {len(changed)} 个，"
+                          f"删除 {len(removed)} 个")
+                rounds += 1
+                try:
+                    exit_code = run_watch_round(session, current, progress_callback)
+                except BrokenProcessPool:
+                    # 检查进程异常退出时重建进程池，下次文件变化时重新检查
+                    print("检查进程异常退出，已重新启动检查进程")
+                    executor.shutdown(wait=False)
+                    executor = session.executor = ProcessPoolExecutor(max_workers=max_workers)
+                    exit_code = EXIT_ERROR
+                if writes_excel and excel_file in current:
+                    # 结果写回地块信息表时，本轮写入造成的变化不再触发下一轮检查
+                    stat = os.stat(excel_file)
+                    current = dict(current, **{excel_file: (stat.st_size, stat.st_mtime_ns)})
+                checked = current
+            previous = current
+            if max_rounds is None or rounds < max_rounds:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        print("监视模式已退出")
+    finally:
+        executor.shutdown()
+    return exit_code
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="地块边界文件规范性检查工具。不带参数运行时弹窗选择文件夹，"
+                    "指定文件夹并加 --no-gui 可在无图形界面的服务器或定时任务中运行。")
+    parser.add_argument('folder', nargs='?',
+                        help="包含边界文件zip和地块信息.xlsx的文件夹（不指定时弹窗选择）")
+    parser.add_argument('--excel', help="地块信息表路径（默认：文件夹/地块信息.xlsx）")
+    parser.add_argument('--output-excel', help="保存result和统计信息工作表的Excel路径（默认：写回地块信息表）")
+    parser.add_argument('--map', dest='map_path', help="HTML地图输出路径（默认：文件夹/地块边界检查结果.html）")
+    parser.add_argument('-j', '--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"并行检查的进程数（默认：{DEFAULT_MAX_WORKERS}）")
+    parser.add_argument('--no-gui', action='store_true', help="不使用图形界面，不弹出进度和结果窗口")
+    parser.add_argument('--streaming', action='store_true',
+                        help="流式模式：结果按块写入磁盘，地图使用外部图层，峰值内存不随ZIP数量增长，适合上万个ZIP的批量检查；"
+                             "结果默认保存到地块信息表旁的 地块信息_检查结果.xlsx")
+    parser.add_argument('--fail-fast', action='store_true',
+                        help="快速预检查：只读取ZIP目录和.shp文件头，没有.shp、缺少.shx/.dbf、文件头无效或点/线图层的ZIP"
+                             "直接报告，不再完整读取")
+    parser.add_argument('--no-overlap-check', action='store_true', help="不检查不同地块之间的边界重叠和完全相同的边界")
+    parser.add_argument('--overlap-min-area', type=float, default=OVERLAP_MIN_AREA,
+                        help=f"报告边界重叠的最小重叠面积，单位平方米（默认：{OVERLAP_MIN_AREA}）")
+    parser.add_argument('--make-valid', action='store_true',
+                        help="用make_valid修复自相交等无效几何后再检查点面包含、中心点和边界重叠（几何无效问题仍会报告）")
+    parser.add_argument('--boundary-layer', metavar='PATTERN',
+                        help="ZIP中有多个shp时选择主边界图层的通配符，匹配shp在ZIP中的相对路径（如 \"*边界*\"，不区分大小写）；"
+                             "不指定时取面积最大的面图层。每个图层各占一行结果，附属图层不检查申报坐标")
+    parser.add_argument('--suggest-point', choices=[SUGGEST_POINT_CENTROID, SUGGEST_POINT_SURFACE],
+                        default=SUGGEST_POINT_CENTROID,
+                        help="未通过点面包含检查时建议坐标的计算方式：centroid 面积加权中心点（默认）；"
+                             "point_on_surface 面内的点，保证建议坐标落在边界内")
+    parser.add_argument('--prefetch', type=int, default=PREFETCH_DEPTH, metavar='N',
+                        help="用后台线程提前读取后续N个ZIP并并行计算增量检查的文件指纹，输入文件夹在网络共享（SMB/NFS）上时"
+                             "可隐藏读取延迟（默认：0，不预读）")
+    parser.add_argument('--prefetch-memory', type=int, default=PREFETCH_MEMORY_MB, metavar='MB',
+                        help=f"预读模式下读取中和检查中的ZIP内容的内存上限，单位MB（默认：{PREFETCH_MEMORY_MB}）")
+    parser.add_argument('--watch', action='store_true',
+                        help="监视模式：常驻运行，定期扫描文件夹，ZIP新增、修改或地块信息表变化后增量检查并更新结果和地图，"
+                             "复用已导入的模块、缓存和检查进程；结果默认保存到 地块信息_检查结果.xlsx，按 Ctrl+C 退出")
+    parser.add_argument('--watch-interval', type=float, default=WATCH_INTERVAL_SECONDS, metavar='SECONDS',
+                        help=f"监视模式扫描文件夹的间隔，单位秒（默认：{WATCH_INTERVAL_SECONDS}）")
+    parser.add_argument('--no-progress', action='store_true', help="不在终端显示进度条")
+    parser.add_argument('--full', action='store_true', help="忽略增量检查缓存，重新检查所有ZIP文件")
+    parser.add_argument('--map-mode', choices=[MAP_MODE_INLINE, MAP_MODE_EXTERNAL], default=MAP_MODE_INLINE,
+                        help="地图输出方式：inline 图层内嵌在HTML中（默认）；external 简化图层写入HTML旁的"
+                             "外部文件，放大或点击时再加载详细边界和属性，适合大批量地块")
+    parser.add_argument('--popup-fields', choices=[POPUP_FIELDS_ALL, POPUP_FIELDS_REQUIRED], default=POPUP_FIELDS_ALL,
+                        help="all 读取全部属性字段并在地图弹窗中显示（默认）；required 只读取检查需要的字段，读取更快")
+    parser.add_argument('--read-engine', choices=['pyogrio', 'fiona'],
+                        help="读取shp的引擎（默认：已安装pyogrio时使用pyogrio）")
+    parser.add_argument('--use-arrow', action='store_true', help="使用pyogrio的Arrow接口读取（需要安装pyarrow）")
+    parser.add_argument('--profile', choices=[PROFILE_CPU, PROFILE_MEMORY],
+                        help="性能分析：cpu 用cProfile分析函数耗时（保存为.prof文件）；memory 用tracemalloc记录各阶段峰值内存")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """命令行入口，返回退出码：0 全部通过，1 存在未通过检查的ZIP，2 输入错误或运行出错"""
+    args = parse_args(argv)
+    try:
+        return run_cli(args)
+    except Exception:
+        # 意外错误返回2，不与“存在未通过检查的ZIP”（1）混淆，定时任务可据此区分工具故障和检查结果
+        print(f"检查过程中出错:\n{traceback.format_exc()}", file=sys.stderr)
+        return EXIT_ERROR
+
+
+def run_cli(args):
+    """按解析后的命令行参数运行检查，返回退出码"""
+    if args.use_arrow and resolve_read_engine(args.read_engine) == 'pyogrio' \
+            and importlib.util.find_spec('pyarrow') is None:
+        # 检查进程中每个ZIP都会读取失败，在开始检查前报错
+        print("错误：--use-arrow 需要安装pyarrow（pip install pyarrow），或去掉该参数")
+        return EXIT_ERROR
+    folder_path = args.folder
+    if folder_path is None:
+        if args.no_gui or tk is None:
+            print("错误：无图形界面模式下必须指定文件夹路径")
+            return EXIT_ERROR
+        folder_path = select_folder_path()
+    if not os.path.isdir(folder_path):
+        print(f"错误：文件夹不存在: {folder_path}")
+        return EXIT_ERROR
+
+    run_kwargs = dict(
+        excel_file=args.excel,
+        output_excel=args.output_excel,
+        map_path=args.map_path,
+        max_workers=args.workers,
+        incremental=not args.full,
+        map_mode=args.map_mode,
+        read_engine=args.read_engine,
+        use_arrow=args.use_arrow,
+        popup_fields=args.popup_fields,
+        profile=args.profile,
+        streaming=args.streaming,
+        fail_fast=args.fail_fast,
+        check_overlaps=not args.no_overlap_check,
+        overlap_min_area=args.overlap_min_area,
+        prefetch_depth=args.prefetch,
+        prefetch_memory_mb=args.prefetch_memory,
+        repair_geometry=args.make_valid,
+        suggest_point=args.suggest_point,
+        boundary_layer=args.boundary_layer,
+    )
+    if args.watch:
+        return watch_folder(folder_path, run_kwargs, args.watch_interval,
+                            progress_callback=None if args.no_progress else ConsoleProgress())
+    if args.no_gui or tk is None:
+        summary = run_boundary_check(folder_path, show_gui=False,
+                                     progress_callback=None if args.no_progress else ConsoleProgress(),
+                                     **run_kwargs)
+    else:
+        # 图形界面模式：检查在后台线程中运行，进度窗口保持响应；结果窗口在主线程中显示
+        outcome = run_with_progress_window(dict(run_kwargs, folder_path=folder_path))
+        if 'error' in outcome:
+            print(f"检查过程中出错:\n{outcome['error']}")
+            return EXIT_ERROR
+        if 'exit_code' in outcome:
+            return outcome['exit_code'] or EXIT_ERROR
+        summary = outcome['summary']
+        if summary['result_df'] is not None:
+            show_dataframe_in_window(summary['result_df'], "边界文件检查结果")
+    layers = f"（{summary['layer_count']} 个图层）" if summary['layer_count'] != summary['zip_count'] else ""
+    print(f"检查完成：共 {summary['zip_count']} 个ZIP{layers}，通过 {summary['pass_count']} 个，"
+          f"未通过 {summary['failed_count']} 个")
+    return EXIT_PASS if summary['failed_count'] == 0 else EXIT_FAILED
+
+
 if __name__ == "__main__":
-    main()
+    multiprocessing.freeze_support()  # 支持PyInstaller打包后的多进程
+    sys.exit(main())